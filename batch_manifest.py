@@ -0,0 +1,121 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Batch modes, matching the CLI menu options
+BATCH_MODES = ('video', 'audio', 'playlist-video', 'playlist-audio')
+
+
+def parse_batch_line(line, default_mode='video'):
+    """
+    Parse one batch input line of the form "URL [mode]".
+
+    Returns (url, mode), or None for blank lines and # comments. Raises
+    ValueError for an unknown mode.
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    parts = line.split()
+    url = parts[0]
+    mode = parts[1].lower() if len(parts) > 1 else default_mode
+    if mode not in BATCH_MODES:
+        raise ValueError(f"Unknown mode '{mode}' (expected one of: {', '.join(BATCH_MODES)})")
+    return url, mode
+
+
+class BatchManifest:
+    """
+    Durable record of a batch run backed by SQLite.
+
+    Every (url, mode) pair is stored once with its status, so a batch that
+    is interrupted and started again skips finished items instead of
+    probing them again. Items left running by a killed run are put back
+    in the pending state when the manifest is opened.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                files TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                UNIQUE (url, mode)
+            )
+        """)
+        self._conn.execute(
+            "UPDATE items SET status = 'pending' WHERE status = 'running'"
+        )
+        self._conn.commit()
+        logger.info(f"Batch manifest opened: {db_path}")
+
+    def add(self, items):
+        """Record (url, mode) pairs not already in the manifest. Returns the number added."""
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO items (url, mode, updated_at) VALUES (?, ?, ?)",
+                ((url, mode, now) for url, mode in items)
+            )
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def retry_failed(self):
+        """Put failed items back in the pending state. Returns the number reset."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE items SET status = 'pending', error = NULL WHERE status = 'failed'"
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def pending(self):
+        """Return pending items in the order they were added."""
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(
+                "SELECT id, url, mode FROM items WHERE status = 'pending' ORDER BY id"
+            )]
+
+    def start(self, item_id):
+        """Mark an item as running."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE items SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (time.time(), item_id)
+            )
+            self._conn.commit()
+
+    def finish(self, item_id, success, files=None, error=None):
+        """Record an item's result and the paths of its downloaded files."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE items SET status = ?, files = ?, error = ?, updated_at = ? WHERE id = ?",
+                ('done' if success else 'failed', json.dumps(files or []), error, time.time(), item_id)
+            )
+            self._conn.commit()
+
+    def summary(self):
+        """Return the number of items in each status."""
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM items GROUP BY status"
+            ).fetchall())
+        return {status: counts.get(status, 0) for status in ('pending', 'running', 'done', 'failed')}
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import statistics
+import subprocess
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from ytdl_engine import DownloadEngine, PROFILE_AUDIO, AUDIO_FORMATS
+
+# --- Configuration ---
+RUNS = 3
+SOURCE_SECONDS = 600  # Length of the generated test track
+FFMPEG_PATH = ""  # Leave empty to use ffmpeg from PATH
+
+def make_source(directory):
+    """Generate an AAC track in an m4a container, like YouTube's format 140."""
+    ffmpeg = os.path.join(FFMPEG_PATH, "ffmpeg") if FFMPEG_PATH else "ffmpeg"
+    path = os.path.join(directory, "source.m4a")
+    subprocess.run(
+        [ffmpeg, "-v", "error", "-y", "-f", "lavfi", "-i", f"sine=frequency=440:duration={SOURCE_SECONDS}",
+         "-c:a", "aac", "-b:a", "128k", path],
+        check=True
+    )
+    return path
+
+def serve(directory):
+    """Serve a directory over HTTP on a free local port."""
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def measure(engine, url, output_path):
+    """Download once and return (wall seconds, CPU seconds including ffmpeg)."""
+    shutil.rmtree(output_path, ignore_errors=True)
+    before = os.times()
+    started = time.perf_counter()
+    result = engine.download(url, PROFILE_AUDIO, output_path)
+    wall = time.perf_counter() - started
+    after = os.times()
+    if not result['success']:
+        raise RuntimeError(result['error'] or "download failed")
+    cpu = sum(getattr(after, field) - getattr(before, field)
+              for field in ("user", "system", "children_user", "children_system"))
+    return wall, cpu, result['files'][0]
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    with tempfile.TemporaryDirectory() as work:
+        source_dir = os.path.join(work, "src")
+        os.makedirs(source_dir)
+        make_source(source_dir)
+        server = serve(source_dir)
+        url = f"http://127.0.0.1:{server.server_address[1]}/source.m4a"
+        print(f"Source: {SOURCE_SECONDS}s AAC track, {runs} runs per audio format\n")
+
+        try:
+            for audio_format in AUDIO_FORMATS:
+                engine = DownloadEngine(FFMPEG_PATH, quiet=True, audio_format=audio_format)
+                samples = [measure(engine, url, os.path.join(work, audio_format)) for _ in range(runs)]
+                engine.close()
+                file = samples[-1][2]
+                print(f"{audio_format:>6}: median wall {statistics.median(s[0] for s in samples):.2f}s, "
+                      f"median CPU {statistics.median(s[1] for s in samples):.2f}s, "
+                      f"output {os.path.basename(file['path'])} ({file['size']/1024/1024:.1f}MB)")
+        finally:
+            server.shutdown()
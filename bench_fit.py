@@ -0,0 +1,53 @@
+import os
+import time
+import tempfile
+import subprocess
+
+from fit_to_size import fit_to_size, probe, choose_strategy
+
+# --- Configuration ---
+SAMPLE_SECONDS = 120  # Length of the generated sample
+SAMPLE_KBPS = 4000  # Video bitrate of the sample, high enough to exceed the budget
+BUDGET = 20 * 1024 * 1024  # Size limit to fit into (Telegram's is 50MB)
+FFMPEG_PATH = ""  # Directory with ffmpeg and ffprobe; empty uses PATH
+
+def make_sample(directory):
+    """Generate a 720p test video with audio."""
+    ffmpeg = os.path.join(FFMPEG_PATH, "ffmpeg") if FFMPEG_PATH else "ffmpeg"
+    path = os.path.join(directory, "sample.mp4")
+    subprocess.run(
+        [ffmpeg, "-v", "error", "-y",
+         "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={SAMPLE_SECONDS}",
+         "-f", "lavfi", "-i", f"sine=frequency=440:duration={SAMPLE_SECONDS}",
+         "-c:v", "libx264", "-preset", "ultrafast", "-b:v", f"{SAMPLE_KBPS}k",
+         "-c:a", "aac", "-b:a", "128k", "-shortest", path],
+        check=True
+    )
+    return path
+
+def measure(path, strategy, out_dir):
+    """Fit path with a strategy and return (wall seconds, CPU seconds, parts)."""
+    before = os.times()
+    started = time.perf_counter()
+    result = fit_to_size(path, BUDGET, out_dir, strategy, FFMPEG_PATH or None)
+    wall = time.perf_counter() - started
+    after = os.times()
+    cpu = (after.children_user - before.children_user) + (after.children_system - before.children_system)
+    return wall, cpu, result['parts']
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as work:
+        print("Generating sample...")
+        sample = make_sample(work)
+        media = probe(sample, FFMPEG_PATH or None)
+        print(f"Sample: {media['duration']:.0f}s, {media['size']/1024/1024:.1f}MB, "
+              f"budget {BUDGET/1024/1024:.0f}MB, automatic choice: {choose_strategy(media, BUDGET)}\n")
+
+        for strategy in ("split", "transcode"):
+            try:
+                wall, cpu, parts = measure(sample, strategy, os.path.join(work, strategy))
+            except Exception as e:
+                print(f"{strategy:>9}: failed ({e})")
+                continue
+            sizes = ", ".join(f"{os.path.getsize(p)/1024/1024:.1f}MB" for p in parts)
+            print(f"{strategy:>9}: wall {wall:.2f}s, CPU {cpu:.2f}s, {len(parts)} part(s): {sizes}")
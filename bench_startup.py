@@ -0,0 +1,54 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import statistics
+import subprocess
+
+# --- Configuration ---
+RUNS = 10
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "yt_downloader.py")
+MENU_PROMPT = b"Enter your choice"
+
+def time_to_menu(home):
+    """Start the CLI and return the seconds until the menu prompt is printed."""
+    env = dict(os.environ, HOME=home, USERPROFILE=home, PYTHONUNBUFFERED="1")
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, SCRIPT], env=env,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    output = b""
+    while MENU_PROMPT not in output:
+        chunk = proc.stdout.read1(4096)
+        if not chunk:
+            raise RuntimeError("CLI exited before showing the menu")
+        output += chunk
+    elapsed = time.perf_counter() - started
+    proc.communicate(b"5\n")
+    return elapsed
+
+def run(label, home, runs):
+    """Measure time-to-menu several times and print a summary."""
+    samples = [time_to_menu(home) for _ in range(runs)]
+    print(f"{label}: median {statistics.median(samples)*1000:.0f}ms, "
+          f"min {min(samples)*1000:.0f}ms, max {max(samples)*1000:.0f}ms")
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    with tempfile.TemporaryDirectory() as home:
+        stamp_path = os.path.join(home, ".yt_downloader_version.json")
+
+        # Cold: no stamp, so the version is read from package metadata.
+        # updated_at is set so no background upgrade is started.
+        cold = {"updated_at": time.time()}
+        with open(stamp_path, "w", encoding="utf-8") as f:
+            json.dump(cold, f)
+        time_to_menu(home)
+        with open(stamp_path, "w", encoding="utf-8") as f:
+            json.dump(cold, f)
+        run("Without cached version", home, 1)
+
+        # Warm: the first run wrote a fresh stamp
+        run("With cached version", home, runs)
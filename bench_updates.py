@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import random
+import time
+
+from telegram import Update
+from telegram.ext import Application, MessageHandler, CallbackQueryHandler, filters
+
+from local_bot_api_stub import StubBotApi
+from update_processor import ChatOrderedUpdateProcessor
+from yt_downloader_bot import (
+    MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES, API_POOL_SIZE, API_POOL_TIMEOUT,
+    GET_UPDATES_POOL_SIZE, GET_UPDATES_READ_TIMEOUT, is_unordered_update
+)
+
+# --- Configuration ---
+CHATS = 20  # Simulated users, each in their own chat
+UPDATES_PER_CHAT = 10  # Alternating URL messages and button presses per chat
+API_LATENCY = 0.05  # Seconds the fake Telegram API takes per call
+HANDLER_WORK = (0.05, 0.3)  # Seconds of non-API awaiting per update (info extraction, queue writes)
+TIMEOUT = 120  # Give up on a run after this many seconds
+
+
+def make_update(chat_id, seq):
+    """A text message or callback query from chat_id carrying its sequence number."""
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f"user{chat_id}"}
+    message = {
+        'message_id': seq, 'date': int(time.time()), 'from': user,
+        'chat': {'id': chat_id, 'type': 'private'}, 'text': f"https://youtu.be/{chat_id}-{seq}",
+    }
+    if seq % 2:
+        return {'callback_query': {
+            'id': f"{chat_id}-{seq}", 'from': user, 'chat_instance': str(chat_id),
+            'message': {**message, 'from': {'id': 1, 'is_bot': True, 'first_name': 'Stub'}},
+            'data': f"vid_best_{seq}",
+        }}
+    return {'message': message}
+
+
+def build_application(stub, mode):
+    """Build an application against the stub the way main() would for mode."""
+    builder = Application.builder().token("1:stub").base_url(stub.base_url).base_file_url(stub.base_file_url)
+    if mode == 'ordered':
+        builder = (
+            builder
+            .concurrent_updates(ChatOrderedUpdateProcessor(
+                MAX_CONCURRENT_UPDATES, max_pending=MAX_PENDING_UPDATES, bypass=is_unordered_update
+            ))
+            .connection_pool_size(API_POOL_SIZE)
+            .pool_timeout(API_POOL_TIMEOUT)
+            .get_updates_connection_pool_size(GET_UPDATES_POOL_SIZE)
+            .get_updates_read_timeout(GET_UPDATES_READ_TIMEOUT)
+        )
+    return builder.build()
+
+
+async def run(mode):
+    """Feed every update through an application in mode and return (seconds, order violations, errors)."""
+    stub = StubBotApi(port=0, latency=API_LATENCY).start()
+    application = build_application(stub, mode)
+    # Handlers finish in a different order than they start unless something serializes them
+    rng = random.Random(7)
+    work = {(chat, seq): rng.uniform(*HANDLER_WORK) for chat in range(1, CHATS + 1) for seq in range(UPDATES_PER_CHAT)}
+    finished = {chat: [] for chat in range(1, CHATS + 1)}
+    errors = []
+    done = asyncio.Event()
+    total = CHATS * UPDATES_PER_CHAT
+
+    async def handle(update, context):
+        chat_id = update.effective_chat.id
+        seq = update.effective_message.message_id
+        try:
+            if update.callback_query:
+                await update.callback_query.answer()
+            else:
+                await update.message.reply_text("🔍 Analyzing URL... Please wait.")
+            await asyncio.sleep(work[(chat_id, seq)])
+            await context.bot.edit_message_text(f"done {seq}", chat_id=chat_id, message_id=seq)
+        except Exception as e:
+            errors.append(e)
+        finished[chat_id].append(seq)
+        if sum(len(seqs) for seqs in finished.values()) == total:
+            done.set()
+
+    block = mode != 'unordered'
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle, block=block))
+    application.add_handler(CallbackQueryHandler(handle, block=block))
+
+    for seq in range(UPDATES_PER_CHAT):
+        for chat in range(1, CHATS + 1):
+            stub.push_update(make_update(chat, seq))
+
+    async with application:
+        await application.updater.start_polling(poll_interval=0, timeout=1, allowed_updates=Update.ALL_TYPES)
+        started = time.perf_counter()
+        await application.start()
+        try:
+            await asyncio.wait_for(done.wait(), TIMEOUT)
+            elapsed = time.perf_counter() - started
+        except asyncio.TimeoutError:
+            elapsed = None
+        await application.updater.stop()
+        await application.stop()
+    stub.stop()
+
+    violations = sum(seqs != sorted(seqs) for seqs in finished.values())
+    return elapsed, violations, errors
+
+
+async def main():
+    total = CHATS * UPDATES_PER_CHAT
+    print(f"{total} updates from {CHATS} chats, {API_LATENCY * 1000:.0f}ms API latency, "
+          f"{HANDLER_WORK[0]:.2f}-{HANDLER_WORK[1]:.2f}s handler work\n")
+    labels = {
+        'sequential': "defaults (one update at a time)",
+        'unordered': "block=False handlers",
+        'ordered': "per-chat ordered processor",
+    }
+    for mode, label in labels.items():
+        elapsed, violations, errors = await run(mode)
+        if elapsed is None:
+            print(f"{label:>32}: timed out after {TIMEOUT}s")
+            continue
+        print(f"{label:>32}: {elapsed:6.2f}s, {total / elapsed:6.1f} updates/s, "
+              f"{violations}/{CHATS} chats out of order, {len(errors)} API errors")
+
+
+if __name__ == "__main__":
+    # Importing the bot turns on INFO logging; keep per-request lines out of the report
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    logging.getLogger('telegram').setLevel(logging.WARNING)
+    asyncio.run(main())
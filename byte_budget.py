@@ -0,0 +1,33 @@
+import asyncio
+
+
+class ByteBudget:
+    """
+    Bytes that may be held at once, e.g. by downloaded files waiting on disk.
+
+    Callers charge a size before using it and release it afterwards. A
+    charge that does not fit waits until enough is released, except when
+    nothing is held, so a single oversized charge cannot wait forever. Use
+    from one event loop.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self._waiters = []
+
+    async def acquire(self, size):
+        """Wait until size bytes fit in the budget and charge them."""
+        while self.used and self.used + size > self.budget:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            await waiter
+        self.used += size
+
+    def release(self, size):
+        """Return size charged bytes and wake the waiting callers."""
+        self.used -= size
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
@@ -0,0 +1,243 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import multiprocessing
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Set inside DownloadExecutor.queued(): jobs over the per-user limit wait instead of failing
+_wait_for_user_slot = contextvars.ContextVar('wait_for_user_slot', default=False)
+
+
+class ExecutorError(Exception):
+    """Base class for errors raised by DownloadExecutor."""
+
+
+class UserLimitError(ExecutorError):
+    """Raised when a user already has the maximum number of jobs running."""
+
+
+class JobTimeoutError(ExecutorError):
+    """Raised when a job does not finish within its timeout."""
+
+
+class JobCancelledError(ExecutorError):
+    """Raised when a job is cancelled before it finishes."""
+
+
+class DownloadExecutor:
+    """
+    Bounded worker pool for blocking yt-dlp calls.
+
+    Jobs run in a thread or process pool so the Telegram event loop keeps
+    answering while extraction and downloads are in progress. A global cap
+    limits how many jobs run at once and a per-user cap stops a single user
+    from taking every slot.
+    """
+
+    def __init__(self, max_workers=4, per_user_limit=2, mode='thread'):
+        if mode == 'thread':
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix='ytdl'
+            )
+        elif mode == 'process':
+            self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            raise ValueError(f"Unknown executor mode: {mode}")
+
+        self.mode = mode
+        self.max_workers = max_workers
+        self.per_user_limit = per_user_limit
+        self._slots = None
+        self._manager = None
+        self._user_jobs = defaultdict(set)
+        # Tasks of users waiting on jobs that no single user owns
+        self._attached = defaultdict(dict)
+        # Tasks of queued jobs waiting for their user to drop below the limit
+        self._waiting = defaultdict(dict)
+        logger.info(f"Download executor started: mode={mode}, workers={max_workers}, per_user={per_user_limit}")
+
+    def _new_cancel_event(self):
+        """Create a cancel flag that can be shared with a worker."""
+        if self.mode == 'process':
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            return self._manager.Event()
+        return threading.Event()
+
+    def active_jobs(self, user_id=None):
+        """
+        Return the number of jobs queued or running.
+
+        For one user this includes the shared jobs the user is attached to.
+        """
+        if user_id is not None:
+            return len(self._user_jobs.get(user_id, ())) + len(self._attached.get(user_id, ()))
+        return sum(len(jobs) for jobs in self._user_jobs.values())
+
+    def active_users(self):
+        """Return the ids of users with jobs queued or running."""
+        users = set(self._user_jobs) | set(self._attached)
+        users.discard(None)
+        return list(users)
+
+    @contextmanager
+    def queued(self):
+        """
+        Make jobs started in this block wait for a per-user slot instead of raising UserLimitError.
+
+        Used for jobs taken from the download queue, which already limits
+        jobs per user and should not be turned away by the executor. Tasks
+        created inside the block inherit the setting.
+        """
+        token = _wait_for_user_slot.set(True)
+        try:
+            yield
+        finally:
+            _wait_for_user_slot.reset(token)
+
+    async def _user_slot(self, user_id):
+        """Return once user_id is below the per-user limit, or raise UserLimitError outside queued()."""
+        while self.active_jobs(user_id) >= self.per_user_limit:
+            if not _wait_for_user_slot.get():
+                raise UserLimitError(f"User {user_id} already has {self.active_jobs(user_id)} jobs running")
+            task = asyncio.current_task()
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiting[user_id][task] = waiter
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                raise JobCancelledError("Job cancelled while waiting for the user's other jobs")
+            finally:
+                waiting = self._waiting.get(user_id, {})
+                waiting.pop(task, None)
+                if not waiting:
+                    self._waiting.pop(user_id, None)
+
+    def _wake(self, user_id):
+        """Let tasks waiting for a slot of user_id check again."""
+        for waiter in self._waiting.get(user_id, {}).values():
+            if not waiter.done():
+                waiter.set_result(None)
+
+    @asynccontextmanager
+    async def attach(self, user_id):
+        """
+        Count the current task as a job of user_id while it waits on a shared job.
+
+        Shared jobs run with user_id None, so no single user owns them. The
+        attached task counts against the user's limit and is what
+        cancel_user() cancels, detaching that user only.
+        """
+        await self._user_slot(user_id)
+        token = object()
+        attached = self._attached[user_id]
+        attached[token] = asyncio.current_task()
+        try:
+            yield
+        finally:
+            del attached[token]
+            if not attached:
+                self._attached.pop(user_id, None)
+            self._wake(user_id)
+
+    async def run(self, user_id, fn, *args, timeout=None, cancellable=False, **kwargs):
+        """
+        Run fn(*args, **kwargs) in the pool on behalf of user_id.
+
+        When cancellable is True, fn receives a cancel_event keyword argument
+        that is set if the job is cancelled or times out, so it can stop
+        cooperatively. A slot stays taken until the worker really returns.
+        user_id None runs a shared job without a per-user limit.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        if user_id is not None:
+            await self._user_slot(user_id)
+        jobs = self._user_jobs[user_id]
+
+        cancel_event = self._new_cancel_event()
+        if cancellable:
+            kwargs['cancel_event'] = cancel_event
+
+        job = (cancel_event, asyncio.current_task())
+        jobs.add(job)
+        loop = asyncio.get_running_loop()
+
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            self._finish(user_id, job)
+            raise JobCancelledError("Job cancelled while waiting for a worker")
+
+        def on_done(_):
+            try:
+                loop.call_soon_threadsafe(self._release, user_id, job)
+            except RuntimeError:
+                # Event loop already closed during shutdown
+                pass
+
+        try:
+            cf_future = self._pool.submit(functools.partial(fn, *args, **kwargs))
+        except Exception:
+            self._release(user_id, job)
+            raise
+        cf_future.add_done_callback(on_done)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(cf_future), timeout)
+        except asyncio.TimeoutError:
+            cancel_event.set()
+            logger.warning(f"Job for user {user_id} timed out after {timeout}s")
+            raise JobTimeoutError(f"Job timed out after {timeout}s")
+        except asyncio.CancelledError:
+            cancel_event.set()
+            raise JobCancelledError("Job cancelled")
+
+    def _release(self, user_id, job):
+        """Free the worker slot held by a finished job."""
+        self._slots.release()
+        self._finish(user_id, job)
+
+    def _finish(self, user_id, job):
+        """Forget a job once it no longer occupies any capacity."""
+        jobs = self._user_jobs.get(user_id)
+        if jobs is not None:
+            jobs.discard(job)
+            if not jobs:
+                del self._user_jobs[user_id]
+        self._wake(user_id)
+
+    def cancel_user(self, user_id):
+        """Cancel every job for a user. Returns the number of jobs cancelled."""
+        jobs = list(self._user_jobs.get(user_id, ()))
+        for cancel_event, task in jobs:
+            cancel_event.set()
+            if task is not None and not task.done():
+                task.cancel()
+        # Waiting tasks detach; the shared job stops once nobody waits for it
+        attached = [task for task in self._attached.get(user_id, {}).values() if not task.done()]
+        attached += [task for task in self._waiting.get(user_id, {}) if not task.done()]
+        for task in attached:
+            task.cancel()
+        cancelled = len(jobs) + len(attached)
+        if cancelled:
+            logger.info(f"Cancelled {cancelled} jobs for user {user_id}")
+        return cancelled
+
+    def shutdown(self, wait=False):
+        """Stop accepting jobs and shut the pool down."""
+        for jobs in self._user_jobs.values():
+            for cancel_event, _ in jobs:
+                cancel_event.set()
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+        logger.info("Download executor shut down")
@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+
+def file_checksum(path):
+    """Return the SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadIndex:
+    """
+    Persistent index of downloaded videos backed by SQLite.
+
+    Each (video_id, fmt) pair maps to the file it was saved as, with its
+    size and checksum. A playlist sync diffs the flat entry list against
+    the index, so only new videos, or videos whose file was deleted or
+    changed size on disk, are downloaded again.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                video_id TEXT NOT NULL,
+                fmt TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                checksum TEXT NOT NULL,
+                downloaded_at REAL NOT NULL,
+                PRIMARY KEY (video_id, fmt)
+            )
+        """)
+        self._conn.commit()
+        logger.info(f"Download index opened: {db_path}")
+
+    def lookup(self, video_id, fmt):
+        """
+        Return the indexed download for a video, or None.
+
+        An entry whose file is gone or has a different size is removed
+        and None is returned.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM downloads WHERE video_id = ? AND fmt = ?", (video_id, fmt)
+            ).fetchone()
+            if row is None:
+                return None
+            if self._is_intact(row):
+                return dict(row)
+            self._conn.execute("DELETE FROM downloads WHERE video_id = ? AND fmt = ?", (video_id, fmt))
+            self._conn.commit()
+            return None
+
+    def _is_intact(self, row):
+        try:
+            return os.path.getsize(row['path']) == row['size']
+        except OSError:
+            return False
+
+    def diff(self, entries, fmt):
+        """
+        Split playlist entries by whether they still need downloading.
+
+        Returns (missing, present, deleted): entries never downloaded or
+        whose file is no longer intact, entries with an intact file, and
+        how many of the missing ones had a file that was deleted or changed.
+        """
+        missing = []
+        present = []
+        deleted = 0
+        with self._lock:
+            rows = {row['video_id']: row for row in self._conn.execute(
+                "SELECT * FROM downloads WHERE fmt = ?", (fmt,)
+            )}
+        for entry in entries:
+            row = rows.get(entry['id'])
+            if row is not None and self._is_intact(row):
+                present.append(entry)
+                continue
+            if row is not None:
+                deleted += 1
+            missing.append(entry)
+        return missing, present, deleted
+
+    def record(self, video_id, fmt, path):
+        """Index a downloaded file."""
+        size = os.path.getsize(path)
+        checksum = file_checksum(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO downloads (video_id, fmt, path, size, checksum, downloaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, fmt, os.path.abspath(path), size, checksum, time.time())
+            )
+            self._conn.commit()
+
+    def verify(self, deep=False):
+        """
+        Drop entries whose file is missing or changed. Returns the number removed.
+
+        With deep=True, checksums are recomputed as well as sizes compared.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM downloads").fetchall()
+        stale = []
+        for row in rows:
+            if not self._is_intact(row) or (deep and file_checksum(row['path']) != row['checksum']):
+                stale.append((row['video_id'], row['fmt']))
+        with self._lock:
+            self._conn.executemany("DELETE FROM downloads WHERE video_id = ? AND fmt = ?", stale)
+            self._conn.commit()
+        return len(stale)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
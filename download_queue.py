@@ -0,0 +1,567 @@
+import heapq
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+
+from shared_store import is_redis_url
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower runs first
+PRIORITY_AUDIO = 0
+PRIORITY_VIDEO = 1
+PRIORITY_PLAYLIST = 2
+
+# Finished jobs used to estimate how long a job takes
+DURATION_SAMPLE_SIZE = 50
+DEFAULT_JOB_DURATION = 60
+
+
+def job_priority(kind, is_audio):
+    """Return the priority class for a job: single audio > single video > playlist."""
+    if kind == 'playlist':
+        return PRIORITY_PLAYLIST
+    return PRIORITY_AUDIO if is_audio else PRIORITY_VIDEO
+
+
+def schedule(pending, running_per_user, last_served, per_user_limit):
+    """
+    Return pending jobs in the order they would be dispatched.
+
+    Users under the limit come first; users at it run as their jobs finish.
+    Within that, jobs go by priority class, then round-robin across users
+    (least recently served first), then oldest first.
+    """
+    last_served = dict(last_served)
+    clock = time.time()
+    order = []
+
+    under_limit = [job for job in pending if running_per_user.get(job['user_id'], 0) < per_user_limit]
+    at_limit = [job for job in pending if running_per_user.get(job['user_id'], 0) >= per_user_limit]
+    for jobs in (under_limit, at_limit):
+        # Each user's jobs per priority class, oldest first
+        classes = defaultdict(lambda: defaultdict(deque))
+        for job in sorted(jobs, key=lambda job: job['id']):
+            classes[job['priority']][job['user_id']].append(job)
+        for priority in sorted(classes):
+            users = classes[priority]
+            heap = [(last_served.get(user_id, 0), queue[0]['id'], user_id) for user_id, queue in users.items()]
+            heapq.heapify(heap)
+            while heap:
+                _, _, user_id = heapq.heappop(heap)
+                queue = users[user_id]
+                order.append(queue.popleft())
+                clock += 1
+                last_served[user_id] = clock
+                if queue:
+                    heapq.heappush(heap, (clock, queue[0]['id'], user_id))
+    return order
+
+
+def with_positions(user_id, active, order, workers, avg):
+    """
+    Return a user's running jobs, then their pending jobs with queue positions.
+
+    Each job dict gets 'position' (1-based, None while running) and 'eta'
+    (estimated seconds until it starts, given the number of workers and
+    the average job duration avg).
+    """
+    jobs = []
+    for job in active:
+        job['position'] = None
+        job['eta'] = 0
+        jobs.append(job)
+    for position, job in enumerate(order, start=1):
+        if job['user_id'] == user_id:
+            job['position'] = position
+            job['eta'] = int((position - 1) // max(1, workers) * avg + avg / 2)
+            jobs.append(job)
+    return jobs
+
+
+class DownloadQueue:
+    """
+    Durable download job queue backed by SQLite.
+
+    Jobs are dispatched by priority class and, within a class, round-robin
+    across users so one user's backlog cannot starve everyone else. Jobs
+    that were running when the process stopped are put back in the queue
+    on startup.
+
+    Several processes can share one database file. Each claims jobs under
+    its owner name, and recover() can be told which owners are still alive
+    so only the jobs of stopped processes are requeued.
+    """
+
+    def __init__(self, db_path, per_user_limit=2, owner=None):
+        self.per_user_limit = per_user_limit
+        self.owner = owner
+        self._last_served = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                is_audio INTEGER NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                owner TEXT
+            )
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        if 'owner' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_user_head ON jobs (status, priority, user_id, id)")
+        self._conn.commit()
+        logger.info(f"Download queue opened: {db_path}")
+
+    def recover(self, is_alive=None):
+        """
+        Requeue jobs left running by a stopped process. Returns the number requeued.
+
+        Without is_alive every running job is requeued. Otherwise only jobs
+        whose owner is unknown or for which is_alive(owner) is false.
+        """
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT owner FROM jobs WHERE status = 'running'"
+            )]
+            dead = [owner for owner in owners if is_alive is None or owner is None or not is_alive(owner)]
+            requeued = 0
+            for owner in dead:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = 'pending', started_at = NULL, owner = NULL "
+                    "WHERE status = 'running' AND owner IS ?", (owner,)
+                )
+                requeued += cursor.rowcount
+            self._conn.commit()
+            return requeued
+
+    def purge_finished(self, max_age=24 * 3600):
+        """Delete finished jobs older than max_age seconds."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN ('pending', 'running') AND finished_at < ?",
+                (time.time() - max_age,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def enqueue(self, user_id, chat_id, message_id, kind, url, quality='best', is_audio=False):
+        """Add a job and return its id."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (user_id, chat_id, message_id, kind, url, quality, is_audio, priority, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, message_id, kind, url, quality, int(is_audio),
+                 job_priority(kind, is_audio), time.time())
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def _schedule(self, pending, running_per_user):
+        """Return pending jobs in the order they would be dispatched."""
+        return schedule(pending, running_per_user, self._last_served, self.per_user_limit)
+
+    def _load(self):
+        """Return pending jobs and the number of running jobs per user."""
+        pending = [dict(row) for row in self._conn.execute(
+            "SELECT * FROM jobs WHERE status = 'pending' ORDER BY id"
+        )]
+        running = {row[0]: row[1] for row in self._conn.execute(
+            "SELECT user_id, COUNT(*) FROM jobs WHERE status = 'running' GROUP BY user_id"
+        )}
+        return pending, running
+
+    def _next_job(self):
+        """
+        Return the job _schedule() would dispatch first, or None if every user is at the limit.
+
+        Only each user's oldest pending job per priority class is read, so
+        a claim does not load the whole queue.
+        """
+        running = {row[0]: row[1] for row in self._conn.execute(
+            "SELECT user_id, COUNT(*) FROM jobs WHERE status = 'running' GROUP BY user_id"
+        )}
+        heads = [
+            (priority, self._last_served.get(user_id, 0), job_id)
+            for priority, user_id, job_id in self._conn.execute(
+                "SELECT priority, user_id, MIN(id) FROM jobs WHERE status = 'pending' GROUP BY priority, user_id"
+            )
+            if running.get(user_id, 0) < self.per_user_limit
+        ]
+        if not heads:
+            return None
+        # Best priority class, then least recently served user, then oldest job
+        job_id = min(heads)[2]
+        return dict(self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def claim_next(self, owner=None):
+        """Mark the next job as running under owner (default self.owner) and return it, or None."""
+        owner = owner or self.owner
+        with self._lock:
+            # Hold the write lock from reading to claiming so other processes cannot take the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            job = self._next_job()
+            if job is None:
+                self._conn.rollback()
+                return None
+
+            now = time.time()
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, owner = ? WHERE id = ?",
+                (now, owner, job['id'])
+            )
+            self._conn.commit()
+            self._last_served[job['user_id']] = now
+            job['status'] = 'running'
+            job['started_at'] = now
+            job['owner'] = owner
+            return job
+
+    def finish(self, job_id, status='done', owner=None):
+        """
+        Record that a job owner (default self.owner) ran finished with the given status.
+
+        Returns False, changing nothing, if the job is no longer running
+        under owner, e.g. because it was requeued and claimed by another
+        process after this one stopped sending heartbeats.
+        """
+        owner = owner or self.owner
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = 'running' AND owner IS ?",
+                (status, time.time(), job_id, owner)
+            )
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def cancel_user(self, user_id):
+        """Cancel a user's pending jobs. Returns the number cancelled."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE user_id = ? AND status = 'pending'",
+                (time.time(), user_id)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def average_duration(self):
+        """Average seconds a recent job took to run."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT AVG(finished_at - started_at) FROM ("
+                "SELECT started_at, finished_at FROM jobs WHERE status = 'done' AND started_at IS NOT NULL "
+                "ORDER BY finished_at DESC LIMIT ?)", (DURATION_SAMPLE_SIZE,)
+            ).fetchone()
+        return row[0] or DEFAULT_JOB_DURATION
+
+    def user_jobs(self, user_id, workers):
+        """
+        Return a user's pending and running jobs with queue positions.
+
+        Each job dict gets 'position' (1-based, None while running) and
+        'eta' (estimated seconds until it starts, given the number of workers).
+        """
+        avg = self.average_duration()
+        with self._lock:
+            pending, running = self._load()
+            order = self._schedule(pending, running)
+            active = [dict(row) for row in self._conn.execute(
+                "SELECT * FROM jobs WHERE status = 'running' AND user_id = ? ORDER BY started_at", (user_id,)
+            )]
+
+        return with_positions(user_id, active, order, workers, avg)
+
+    def depth(self):
+        """Return the number of pending and running jobs."""
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN ('pending', 'running') GROUP BY status"
+            ).fetchall())
+        return {'pending': counts.get('pending', 0), 'running': counts.get('running', 0)}
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+# Seconds a finished job stays in Redis, like purge_finished()'s default
+FINISHED_TTL = 24 * 3600
+
+_INT_FIELDS = ('id', 'user_id', 'chat_id', 'message_id', 'is_audio', 'priority')
+_FLOAT_FIELDS = ('created_at', 'started_at', 'finished_at')
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisQueue:
+    """
+    Download job queue on a Redis-compatible server, for front-ends and
+    workers on different hosts.
+
+    Dispatches jobs in the same order as DownloadQueue, with the per-user
+    limit and the round-robin state shared by every process. Each change
+    runs as a WATCH/MULTI transaction, so concurrent claims never take the
+    same job. Needs the redis package; any client with the redis-py
+    interface, such as fakeredis, can be passed in instead of a URL.
+    """
+
+    def __init__(self, url=None, client=None, per_user_limit=2, owner=None, prefix="ytbot:queue:"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self.per_user_limit = per_user_limit
+        self.owner = owner
+        self.prefix = prefix
+        logger.info(f"Download queue connected: {url or type(client).__name__}")
+
+    def _key(self, *parts):
+        return self.prefix + ":".join(str(part) for part in parts)
+
+    def _transaction(self, fn):
+        """Run fn(pipe) until no other change to the queue interleaves with it; return its result."""
+        return self._client.transaction(fn, self._key('version'), value_from_callable=True)
+
+    def _job(self, job_id):
+        """Load a job as a dict with the same fields as a DownloadQueue row, or None."""
+        return self._parse(self._client.hgetall(self._key('job', job_id)))
+
+    def _jobs(self, job_ids):
+        """Load several jobs in one round trip, leaving out those that expired."""
+        pipe = self._client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(self._key('job', job_id))
+        return [job for job in map(self._parse, pipe.execute()) if job]
+
+    @staticmethod
+    def _parse(raw):
+        if not raw:
+            return None
+        job = {}
+        for field, value in raw.items():
+            field, value = _decode(field), _decode(value)
+            if value == '':
+                value = None
+            elif field in _INT_FIELDS:
+                value = int(value)
+            elif field in _FLOAT_FIELDS:
+                value = float(value)
+            job[field] = value
+        return job
+
+    def _counts(self, pipe, name):
+        return {int(_decode(user)): float(_decode(value)) for user, value in pipe.hgetall(self._key(name)).items()}
+
+    def recover(self, is_alive=None):
+        """
+        Requeue jobs left running by a stopped process. Returns the number requeued.
+
+        Without is_alive every running job is requeued. Otherwise only jobs
+        whose owner is unknown or for which is_alive(owner) is false.
+        """
+        alive = {}
+
+        def requeue(pipe):
+            running = {int(_decode(job_id)): _decode(owner) or None
+                       for job_id, owner in pipe.hgetall(self._key('running')).items()}
+            for owner in set(running.values()) - set(alive):
+                alive[owner] = is_alive is not None and owner is not None and is_alive(owner)
+            dead = [job_id for job_id, owner in running.items() if not alive[owner]]
+            counts = self._counts(pipe, 'running_users')
+            jobs = []
+            for job_id in dead:
+                user_id, priority = pipe.hmget(self._key('job', job_id), 'user_id', 'priority')
+                if user_id is not None:
+                    jobs.append((job_id, int(user_id), int(priority)))
+
+            pipe.multi()
+            for job_id, user_id, priority in jobs:
+                pipe.hset(self._key('job', job_id), mapping={'status': 'pending', 'started_at': '', 'owner': ''})
+                pipe.zadd(self._key('pending', priority, user_id), {job_id: job_id})
+                pipe.sadd(self._key('pending_users', priority), user_id)
+                pipe.hdel(self._key('running'), job_id)
+                counts[user_id] = counts.get(user_id, 0) - 1
+            for user_id in {user_id for _, user_id, _ in jobs}:
+                if counts[user_id] > 0:
+                    pipe.hset(self._key('running_users'), user_id, int(counts[user_id]))
+                else:
+                    pipe.hdel(self._key('running_users'), user_id)
+            pipe.incr(self._key('version'))
+            return len(jobs)
+
+        return self._transaction(requeue)
+
+    def purge_finished(self, max_age=FINISHED_TTL):
+        """Finished jobs expire on the server after FINISHED_TTL."""
+        return 0
+
+    def enqueue(self, user_id, chat_id, message_id, kind, url, quality='best', is_audio=False):
+        """Add a job and return its id."""
+        job_id = self._client.incr(self._key('next_id'))
+        priority = job_priority(kind, is_audio)
+        pipe = self._client.pipeline()
+        pipe.hset(self._key('job', job_id), mapping={
+            'id': job_id, 'user_id': user_id, 'chat_id': chat_id, 'message_id': message_id,
+            'kind': kind, 'url': url, 'quality': quality, 'is_audio': int(is_audio), 'priority': priority,
+            'status': 'pending', 'created_at': time.time(), 'started_at': '', 'finished_at': '', 'owner': '',
+        })
+        pipe.zadd(self._key('pending', priority, user_id), {job_id: job_id})
+        pipe.sadd(self._key('pending_users', priority), user_id)
+        # Fails the claims and cancels that read the queue before this job was added
+        pipe.incr(self._key('version'))
+        pipe.execute()
+        return job_id
+
+    def claim_next(self, owner=None):
+        """Mark the next job as running under owner (default self.owner) and return it, or None."""
+        owner = owner or self.owner
+
+        def claim(pipe):
+            running = self._counts(pipe, 'running_users')
+            last_served = self._counts(pipe, 'last_served')
+            # Each eligible user's oldest job in each priority class
+            heads = []
+            for priority in (PRIORITY_AUDIO, PRIORITY_VIDEO, PRIORITY_PLAYLIST):
+                for user_id in map(int, pipe.smembers(self._key('pending_users', priority))):
+                    if running.get(user_id, 0) >= self.per_user_limit:
+                        continue
+                    head = pipe.zrange(self._key('pending', priority, user_id), 0, 1)
+                    if head:
+                        heads.append((priority, last_served.get(user_id, 0), int(head[0]), user_id, len(head)))
+            if not heads:
+                return None
+
+            # Best priority class, then least recently served user, then oldest job
+            priority, _, job_id, user_id, left = min(heads)
+            now = time.time()
+            pipe.multi()
+            pipe.zrem(self._key('pending', priority, user_id), job_id)
+            if left == 1:
+                pipe.srem(self._key('pending_users', priority), user_id)
+            pipe.hset(self._key('job', job_id), mapping={'status': 'running', 'started_at': now, 'owner': owner or ''})
+            pipe.hset(self._key('running'), job_id, owner or '')
+            pipe.hincrby(self._key('running_users'), user_id, 1)
+            pipe.hset(self._key('last_served'), user_id, now)
+            pipe.incr(self._key('version'))
+            return job_id
+
+        job_id = self._transaction(claim)
+        return self._job(job_id) if job_id is not None else None
+
+    def finish(self, job_id, status='done', owner=None):
+        """
+        Record that a job owner (default self.owner) ran finished with the given status.
+
+        Returns False, changing nothing, if the job is no longer running
+        under owner, e.g. because it was requeued and claimed by another
+        process after this one stopped sending heartbeats.
+        """
+        owner = owner or self.owner
+
+        def record(pipe):
+            if _decode(pipe.hget(self._key('running'), job_id)) != (owner or ''):
+                return False
+            user_id, started_at = pipe.hmget(self._key('job', job_id), 'user_id', 'started_at')
+            count = int(pipe.hget(self._key('running_users'), user_id) or 0) if user_id else 0
+            now = time.time()
+
+            pipe.multi()
+            pipe.hset(self._key('job', job_id), mapping={'status': status, 'finished_at': now})
+            pipe.expire(self._key('job', job_id), FINISHED_TTL)
+            pipe.hdel(self._key('running'), job_id)
+            if count > 1:
+                pipe.hincrby(self._key('running_users'), user_id, -1)
+            else:
+                pipe.hdel(self._key('running_users'), user_id)
+            if status == 'done' and _decode(started_at):
+                pipe.lpush(self._key('durations'), now - float(started_at))
+                pipe.ltrim(self._key('durations'), 0, DURATION_SAMPLE_SIZE - 1)
+            pipe.incr(self._key('version'))
+            return True
+
+        return self._transaction(record)
+
+    def cancel_user(self, user_id):
+        """Cancel a user's pending jobs. Returns the number cancelled."""
+        def cancel(pipe):
+            pending = {
+                priority: pipe.zrange(self._key('pending', priority, user_id), 0, -1)
+                for priority in (PRIORITY_AUDIO, PRIORITY_VIDEO, PRIORITY_PLAYLIST)
+            }
+            now = time.time()
+
+            pipe.multi()
+            for priority, job_ids in pending.items():
+                for job_id in job_ids:
+                    job_key = self._key('job', int(job_id))
+                    pipe.hset(job_key, mapping={'status': 'cancelled', 'finished_at': now})
+                    pipe.expire(job_key, FINISHED_TTL)
+                pipe.delete(self._key('pending', priority, user_id))
+                pipe.srem(self._key('pending_users', priority), user_id)
+            pipe.incr(self._key('version'))
+            return sum(len(job_ids) for job_ids in pending.values())
+
+        return self._transaction(cancel)
+
+    def average_duration(self):
+        """Average seconds a recent job took to run."""
+        durations = [float(value) for value in self._client.lrange(self._key('durations'), 0, -1)]
+        return sum(durations) / len(durations) if durations else DEFAULT_JOB_DURATION
+
+    def _pending_ids(self):
+        """Return the ids of all pending jobs."""
+        pipe = self._client.pipeline(transaction=False)
+        for priority in (PRIORITY_AUDIO, PRIORITY_VIDEO, PRIORITY_PLAYLIST):
+            for user_id in map(int, self._client.smembers(self._key('pending_users', priority))):
+                pipe.zrange(self._key('pending', priority, user_id), 0, -1)
+        return [int(job_id) for job_ids in pipe.execute() for job_id in job_ids]
+
+    def user_jobs(self, user_id, workers):
+        """
+        Return a user's pending and running jobs with queue positions.
+
+        Each job dict gets 'position' (1-based, None while running) and
+        'eta' (estimated seconds until it starts, given the number of workers).
+        """
+        avg = self.average_duration()
+        pending = self._jobs(self._pending_ids())
+        running = self._counts(self._client, 'running_users')
+        order = schedule(pending, running, self._counts(self._client, 'last_served'), self.per_user_limit)
+        active = [job for job in self._jobs(map(int, self._client.hkeys(self._key('running'))))
+                  if job['user_id'] == user_id]
+        active.sort(key=lambda job: job['started_at'] or 0)
+        return with_positions(user_id, active, order, workers, avg)
+
+    def depth(self):
+        """Return the number of pending and running jobs."""
+        return {'pending': len(self._pending_ids()), 'running': self._client.hlen(self._key('running'))}
+
+    def close(self):
+        """Close the connection."""
+        self._client.close()
+
+
+def open_queue(store_url, db_path, per_user_limit=2, owner=None):
+    """Open the queue that goes with a shared store: Redis for a Redis store, otherwise SQLite at db_path."""
+    if store_url and is_redis_url(store_url):
+        return RedisQueue(store_url, per_user_limit=per_user_limit, owner=owner)
+    return DownloadQueue(db_path, per_user_limit=per_user_limit, owner=owner)
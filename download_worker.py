@@ -0,0 +1,86 @@
+import argparse
+import logging
+import multiprocessing
+import signal
+import time
+
+import yt_downloader_bot as bot
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+WORKER_PROCESSES = 2  # Worker processes started by this command
+RESTART_DELAY = 5  # Seconds before a crashed worker is started again
+STOP_TIMEOUT = 30  # Seconds workers get to finish cleaning up on Ctrl+C
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run queued bot downloads in separate worker processes.")
+    parser.add_argument(
+        "--queue", default=bot.QUEUE_PATH,
+        help="Queue database on this host (not used with a Redis --store, which holds the queue), "
+             "or the URL of a front-end's state server, e.g. https://host behind a TLS proxy"
+    )
+    parser.add_argument("--store", default=bot.SHARED_STORE_URL,
+                        help="Shared store URL; not needed with a state server URL")
+    parser.add_argument("--token", default=bot.STATE_SERVER_TOKEN, help="State server token")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="Worker processes to run")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics from this port on, one port per worker")
+    return parser.parse_args()
+
+
+def stop_on_signal(signum, frame):
+    """Turn the first SIGINT or SIGTERM into KeyboardInterrupt and ignore the rest, so cleanup runs once."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def run_worker(queue, store, token, metrics_port):
+    """Worker process entry point."""
+    signal.signal(signal.SIGINT, stop_on_signal)
+    signal.signal(signal.SIGTERM, stop_on_signal)
+    bot.run_download_worker(queue, store, token, metrics_port)
+
+
+def start_worker(context, args, index):
+    """Start the index-th worker; a restarted worker keeps its metrics port."""
+    metrics_port = args.metrics_port + index if args.metrics_port else None
+    process = context.Process(target=run_worker, args=(args.queue, args.store, args.token, metrics_port))
+    process.start()
+    return process
+
+
+def supervise(args):
+    """Keep args.processes workers running, restarting any that exit."""
+    context = multiprocessing.get_context('spawn')
+    # Stop the same way under a service manager as on Ctrl+C
+    signal.signal(signal.SIGTERM, stop_on_signal)
+    workers = [start_worker(context, args, i) for i in range(args.processes)]
+    print(f"⚙️ Started {len(workers)} download workers for {args.queue}")
+    try:
+        while True:
+            time.sleep(RESTART_DELAY)
+            for i, process in enumerate(workers):
+                if not process.is_alive():
+                    # The front-end requeues its jobs once its heartbeat expires
+                    logger.warning(f"Worker {process.pid} exited with code {process.exitcode}, restarting")
+                    workers[i] = start_worker(context, args, i)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping workers")
+    finally:
+        # Workers clean up on SIGTERM as on Ctrl+C; kill any that take too long
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for process in workers:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+
+if __name__ == "__main__":
+    supervise(parse_args())
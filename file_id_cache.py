@@ -0,0 +1,106 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class FileIdCache:
+    """
+    Persistent cache of Telegram file_ids for files the bot already uploaded.
+
+    Entries are keyed by canonical video id, quality and audio/video mode so
+    a repeat request can be answered by re-sending the file_id instead of
+    downloading and uploading the file again.
+    """
+
+    def __init__(self, db_path, ttl=30 * 24 * 3600):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS file_ids (
+                video_id TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (video_id, quality, mode)
+            )
+        """)
+        self._conn.commit()
+        logger.info(f"File id cache opened: {db_path}")
+
+    @staticmethod
+    def _mode(audio_only):
+        return 'audio' if audio_only else 'video'
+
+    def get(self, video_id, quality, audio_only):
+        """Return the cached file_id for a request, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id, created_at FROM file_ids WHERE video_id = ? AND quality = ? AND mode = ?",
+                (video_id, quality, self._mode(audio_only))
+            ).fetchone()
+
+            if row and time.time() - row[1] > self.ttl:
+                self._conn.execute(
+                    "DELETE FROM file_ids WHERE video_id = ? AND quality = ? AND mode = ?",
+                    (video_id, quality, self._mode(audio_only))
+                )
+                self._conn.commit()
+                row = None
+
+            if row:
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, video_id, quality, audio_only, file_id):
+        """Remember the file_id Telegram returned for an upload."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_ids (video_id, quality, mode, file_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                (video_id, quality, self._mode(audio_only), file_id, time.time())
+            )
+            self._conn.commit()
+
+    def invalidate(self, video_id, quality, audio_only):
+        """Drop an entry, e.g. when Telegram no longer accepts its file_id."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM file_ids WHERE video_id = ? AND quality = ? AND mode = ?",
+                (video_id, quality, self._mode(audio_only))
+            )
+            self._conn.commit()
+
+    def purge_expired(self):
+        """Delete every expired entry. Returns the number of rows removed."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM file_ids WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self):
+        """Return hit/miss counters and the number of stored entries."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+        }
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,171 @@
+import json
+import logging
+import math
+import os
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# Keep parts and transcodes a little under the limit; container overhead and
+# keyframe-aligned cuts make sizes approximate
+FIT_SAFETY_MARGIN = 0.92
+
+# Below these bitrates a transcode is not worth watching, so split instead
+MIN_VIDEO_KBPS = 200
+MIN_AUDIO_KBPS = 32
+TRANSCODE_AUDIO_KBPS = 96
+
+# Most parts a file is split into before a transcode is preferred
+MAX_SPLIT_PARTS = 8
+# Attempts at shrinking segment length when a keyframe-aligned part is too big
+SPLIT_ATTEMPTS = 4
+
+# Cost model used to pick the cheaper strategy, in rough seconds
+COPY_BYTES_PER_SECOND = 200 * 1024 * 1024  # Stream copy is bound by disk speed
+TRANSCODE_REALTIME_FACTOR = 4.0  # libx264 veryfast, media seconds per wall second
+UPLOAD_BYTES_PER_SECOND = 5 * 1024 * 1024  # Telegram upload throughput
+
+
+class FitError(Exception):
+    """The file cannot be made to fit."""
+
+
+def _tool(ffmpeg_location, name):
+    return os.path.join(ffmpeg_location, name) if ffmpeg_location else name
+
+
+def probe(path, ffmpeg_location=None):
+    """Return {'duration', 'size', 'has_video'} for a media file using ffprobe."""
+    result = subprocess.run(
+        [_tool(ffmpeg_location, 'ffprobe'), '-v', 'error', '-show_entries', 'format=duration:stream=codec_type',
+         '-of', 'json', path],
+        capture_output=True, text=True, check=True
+    )
+    data = json.loads(result.stdout)
+    return {
+        'duration': float(data.get('format', {}).get('duration') or 0),
+        'size': os.path.getsize(path),
+        'has_video': any(s.get('codec_type') == 'video' for s in data.get('streams', [])),
+    }
+
+
+def transcode_bitrate(duration, budget, has_video=True):
+    """
+    Return the kbit/s to encode at so duration seconds fit in budget bytes.
+
+    For video this is the video bitrate, with TRANSCODE_AUDIO_KBPS left for
+    audio. Returns None when the result would be below the usable minimum.
+    """
+    if not duration:
+        return None
+    total_kbps = budget * FIT_SAFETY_MARGIN * 8 / 1000 / duration
+    if not has_video:
+        return int(total_kbps) if total_kbps >= MIN_AUDIO_KBPS else None
+    video_kbps = total_kbps - TRANSCODE_AUDIO_KBPS
+    return int(video_kbps) if video_kbps >= MIN_VIDEO_KBPS else None
+
+
+def choose_strategy(media, budget):
+    """
+    Pick 'split' or 'transcode' for a file that is larger than budget.
+
+    Both are costed as processing time plus upload time; a split uploads
+    every byte but costs almost no CPU, a transcode uploads about budget
+    bytes but runs an encoder over the whole duration. Returns None when
+    neither can work.
+    """
+    parts = math.ceil(media['size'] / (budget * FIT_SAFETY_MARGIN))
+    can_split = media['duration'] > 0 and parts <= MAX_SPLIT_PARTS
+    can_transcode = transcode_bitrate(media['duration'], budget, media['has_video']) is not None
+
+    split_cost = media['size'] / COPY_BYTES_PER_SECOND + media['size'] / UPLOAD_BYTES_PER_SECOND
+    transcode_cost = media['duration'] / TRANSCODE_REALTIME_FACTOR + budget / UPLOAD_BYTES_PER_SECOND
+
+    if can_split and (not can_transcode or split_cost <= transcode_cost):
+        return 'split'
+    if can_transcode:
+        return 'transcode'
+    return None
+
+
+def split_by_size(path, media, budget, out_dir, ffmpeg_location=None):
+    """Split a file into parts under budget bytes by stream copy. Returns the part paths in order."""
+    base, ext = os.path.splitext(os.path.basename(path))
+    segment_time = media['duration'] * budget * FIT_SAFETY_MARGIN / media['size']
+
+    for _ in range(SPLIT_ATTEMPTS):
+        for name in os.listdir(out_dir):
+            os.remove(os.path.join(out_dir, name))
+        pattern = os.path.join(out_dir, f"{base} part%03d{ext}")
+        subprocess.run(
+            [_tool(ffmpeg_location, 'ffmpeg'), '-v', 'error', '-y', '-i', path, '-map', '0', '-c', 'copy',
+             '-f', 'segment', '-segment_time', f"{segment_time:.3f}", '-reset_timestamps', '1', pattern],
+            capture_output=True, text=True, check=True
+        )
+        parts = sorted(os.path.join(out_dir, name) for name in os.listdir(out_dir))
+        if parts and all(os.path.getsize(part) <= budget for part in parts):
+            return parts
+        # Cuts land on keyframes, so a part can overshoot; try shorter segments
+        segment_time *= 0.8
+
+    raise FitError("Could not split the file into small enough parts")
+
+
+def transcode_to_size(path, media, budget, out_dir, ffmpeg_location=None):
+    """Re-encode a file at the bitrate that fits budget bytes. Returns the new path."""
+    kbps = transcode_bitrate(media['duration'], budget, media['has_video'])
+    if kbps is None:
+        raise FitError("The file is too long to fit at a usable bitrate")
+
+    base = os.path.splitext(os.path.basename(path))[0]
+    if media['has_video']:
+        out_path = os.path.join(out_dir, f"{base}.mp4")
+        codec_args = [
+            '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', f"{kbps}k",
+            '-maxrate', f"{kbps}k", '-bufsize', f"{kbps * 2}k",
+            '-c:a', 'aac', '-b:a', f"{TRANSCODE_AUDIO_KBPS}k", '-movflags', '+faststart',
+        ]
+    else:
+        out_path = os.path.join(out_dir, f"{base}.m4a")
+        codec_args = ['-vn', '-c:a', 'aac', '-b:a', f"{kbps}k"]
+
+    subprocess.run(
+        [_tool(ffmpeg_location, 'ffmpeg'), '-v', 'error', '-y', '-i', path, *codec_args, out_path],
+        capture_output=True, text=True, check=True
+    )
+    if os.path.getsize(out_path) > budget:
+        raise FitError("Transcoded file is still too large")
+    return out_path
+
+
+def fit_to_size(path, budget, out_dir=None, strategy=None, ffmpeg_location=None):
+    """
+    Make a media file fit in budget bytes.
+
+    Uses the cheaper of splitting and transcoding unless strategy is given.
+    Results are written to out_dir (default: a new directory next to path).
+    Returns {'strategy', 'parts'}; a file that already fits is returned
+    as its only part.
+    """
+    media = probe(path, ffmpeg_location)
+    if media['size'] <= budget:
+        return {'strategy': None, 'parts': [path]}
+
+    strategy = strategy or choose_strategy(media, budget)
+    if strategy is None:
+        raise FitError("The file is too large to split or transcode")
+
+    if out_dir is None:
+        out_dir = os.path.join(os.path.dirname(path), f"fit_{strategy}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    logger.info(f"Fitting {os.path.basename(path)} ({media['size']} bytes, {media['duration']:.0f}s) "
+                f"into {budget} bytes by {strategy}")
+    try:
+        if strategy == 'split':
+            parts = split_by_size(path, media, budget, out_dir, ffmpeg_location)
+        else:
+            parts = [transcode_to_size(path, media, budget, out_dir, ffmpeg_location)]
+    except subprocess.CalledProcessError as e:
+        raise FitError(f"ffmpeg failed: {(e.stderr or '').strip()[:200]}")
+    return {'strategy': strategy, 'parts': parts}
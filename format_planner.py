@@ -0,0 +1,126 @@
+# Estimates from bitrate are approximate, so keep some headroom under the budget
+SIZE_SAFETY_MARGIN = 0.95
+
+# Bitrate of the MP3 produced by audio extraction
+AUDIO_EXTRACT_KBPS = 192
+
+
+def estimate_size(fmt, duration):
+    """Estimate the size of a format in bytes, or None if it cannot be sized."""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    tbr = fmt.get('tbr')
+    if tbr and duration:
+        # tbr is in kbit/s
+        return int(tbr * 1000 / 8 * duration)
+    return None
+
+
+def _is_usable(fmt):
+    """Skip storyboards, manifests without media and DRM formats."""
+    if fmt.get('has_drm') or fmt.get('ext') == 'mhtml':
+        return False
+    return fmt.get('vcodec') != 'none' or fmt.get('acodec') != 'none'
+
+
+def _has_video(fmt):
+    return fmt.get('vcodec') not in (None, 'none')
+
+
+def _has_audio(fmt):
+    return fmt.get('acodec') not in (None, 'none')
+
+
+def _rank(fmt):
+    """Sort key for a format: resolution first, then bitrate, then mp4/m4a."""
+    return (
+        fmt.get('height') or 0,
+        fmt.get('tbr') or 0,
+        fmt.get('ext') in ('mp4', 'm4a'),
+    )
+
+
+def plan_format(formats, duration, budget, max_height=None):
+    """
+    Choose the best video+audio combination that fits in budget bytes.
+
+    Returns a dict with 'format_id' (a yt-dlp format selector), 'size' (the
+    estimated bytes) and 'height', or None when no sized combination fits.
+    Formats whose size cannot be estimated are never chosen.
+    """
+    limit = budget * SIZE_SAFETY_MARGIN
+    sized = []
+    for fmt in formats or []:
+        if not _is_usable(fmt):
+            continue
+        if max_height and (fmt.get('height') or 0) > max_height:
+            continue
+        size = estimate_size(fmt, duration)
+        if size:
+            sized.append((fmt, size))
+
+    audio_only = sorted(
+        [(f, s) for f, s in sized if _has_audio(f) and not _has_video(f)],
+        key=lambda item: _rank(item[0]), reverse=True
+    )
+    candidates = []
+
+    for fmt, size in sized:
+        if not _has_video(fmt):
+            continue
+        if _has_audio(fmt):
+            if size <= limit:
+                candidates.append((_rank(fmt), fmt['format_id'], size, fmt.get('height')))
+            continue
+        # Video-only stream: pair with the best audio stream that still fits
+        for audio, audio_size in audio_only:
+            if size + audio_size <= limit:
+                rank = (fmt.get('height') or 0, (fmt.get('tbr') or 0) + (audio.get('tbr') or 0),
+                        fmt.get('ext') == 'mp4' and audio.get('ext') == 'm4a')
+                candidates.append((rank, f"{fmt['format_id']}+{audio['format_id']}", size + audio_size, fmt.get('height')))
+                break
+
+    if not candidates:
+        return None
+
+    _, format_id, size, height = max(candidates, key=lambda c: c[0])
+    return {'format_id': format_id, 'size': size, 'height': height}
+
+
+def plan_audio(formats, duration, budget, keep_exts=()):
+    """
+    Choose the best audio stream within budget bytes.
+
+    Audio-only streams whose ext is in keep_exts are kept as they are, so
+    the estimate is the stream's own size. Otherwise the best stream is
+    planned for MP3 extraction and the estimate is the size of the MP3.
+    Returns the same dict shape as plan_format, or None if it cannot fit.
+    """
+    audio = [f for f in formats or [] if _is_usable(f) and _has_audio(f) and not _has_video(f)]
+    limit = budget * SIZE_SAFETY_MARGIN
+
+    native = []
+    for fmt in audio:
+        size = estimate_size(fmt, duration) if fmt.get('ext') in keep_exts else None
+        if size and size <= limit:
+            native.append((fmt, size))
+    if native:
+        best, size = max(native, key=lambda item: _rank(item[0]))
+        return {'format_id': best['format_id'], 'size': size, 'height': None}
+
+    if not duration:
+        return None
+    size = int(AUDIO_EXTRACT_KBPS * 1000 / 8 * duration)
+    if size > limit:
+        return None
+
+    if not audio:
+        return {'format_id': 'bestaudio/best', 'size': size, 'height': None}
+    best = max(audio, key=_rank)
+    return {'format_id': best['format_id'], 'size': size, 'height': None}
+
+
+def has_size_info(formats, duration):
+    """Return True if at least one format can be sized."""
+    return any(_is_usable(f) and estimate_size(f, duration) for f in formats or [])
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import itertools
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+HOST = "127.0.0.1"
+PORT = 8081
+MAX_FILE_SIZE = 2000 * 1024 * 1024  # Same limit as telegram-bot-api --local
+MEDIA_PARAMS = ('video', 'audio', 'document')
+LISTEN_BACKLOG = 256  # Room for load tests that open many connections at once
+
+
+class StubServer(ThreadingHTTPServer):
+    request_queue_size = LISTEN_BACKLOG
+    daemon_threads = True
+
+
+class StubBotApi:
+    """
+    Stand-in for a self-hosted Bot API server in --local mode.
+
+    Answers the methods the bot uses, accepts media as file:// paths
+    (checking that the file exists and is under MAX_FILE_SIZE) and records
+    every call in self.calls for inspection. Polling returns updates added
+    with push_update(); latency adds a delay to every other call to stand
+    in for the round trip to Telegram.
+    """
+
+    def __init__(self, host=HOST, port=PORT, latency=0):
+        self.calls = []
+        self.latency = latency
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._updates = []
+        self._updates_ready = threading.Condition()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._handle(self)
+
+            def do_POST(self):
+                stub._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = StubServer((host, port), Handler)
+        self.base_url = f"http://{host}:{self._server.server_address[1]}/bot"
+        self.base_file_url = f"http://{host}:{self._server.server_address[1]}/file/bot"
+
+    def start(self):
+        """Serve in a background thread."""
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def push_update(self, update):
+        """Queue an update (a Bot API Update dict without update_id) for getUpdates."""
+        with self._updates_ready:
+            self._updates.append({'update_id': next(self._update_ids), **update})
+            self._updates_ready.notify_all()
+
+    def _get_updates(self, params):
+        """Confirm updates below offset and return the rest, long polling up to 1s."""
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        with self._updates_ready:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            if not self._updates:
+                self._updates_ready.wait(min(float(params.get('timeout', 0) or 0), 1.0))
+            return self._updates[:limit]
+
+    def _handle(self, request):
+        """Dispatch /bot<token>/<method> to an answer."""
+        method = request.path.rsplit('/', 1)[-1].split('?')[0]
+        params = self._read_params(request)
+        self.calls.append((method, params))
+
+        ok, result = self._answer(method, params)
+        body = json.dumps({'ok': True, 'result': result} if ok else
+                          {'ok': False, 'error_code': 400, 'description': result}).encode()
+        request.send_response(200 if ok else 400)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        try:
+            request.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, e.g. a long poll cut short by shutdown
+            pass
+
+    def _read_params(self, request):
+        length = int(request.headers.get('Content-Length') or 0)
+        raw = request.rfile.read(length) if length else b''
+        content_type = request.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            return json.loads(raw or b'{}')
+        if content_type.startswith('multipart/form-data'):
+            # A real upload; local mode should never need one
+            return {'multipart_bytes': len(raw)}
+        query = urllib.parse.urlparse(request.path).query
+        params = urllib.parse.parse_qs(raw.decode() or query)
+        return {key: values[-1] for key, values in params.items()}
+
+    def _message(self, params, **extra):
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+            **extra,
+        }
+
+    def _answer(self, method, params):
+        """Return (ok, result or error description) for a Bot API call."""
+        if method == 'getMe':
+            return True, {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+        if method == 'getUpdates':
+            return True, self._get_updates(params)
+        if self.latency:
+            time.sleep(self.latency)
+        if method in ('deleteWebhook', 'setWebhook', 'close', 'logOut', 'answerCallbackQuery'):
+            return True, True
+        if method in ('sendMessage', 'editMessageText'):
+            return True, self._message(params, text=params.get('text', ''))
+
+        media = next((name for name in MEDIA_PARAMS if name in params), None)
+        if method.startswith('send') and media:
+            value = params[media]
+            if 'multipart_bytes' in params:
+                return False, "Bad Request: expected a file:// path in local mode"
+            if not value.startswith('file://'):
+                # A file_id from an earlier upload
+                return True, self._message(params, **{media: {'file_id': value, 'file_unique_id': value}})
+            path = urllib.parse.unquote(value[len('file://'):])
+            if not os.path.isfile(path):
+                return False, f"Bad Request: file not found: {path}"
+            size = os.path.getsize(path)
+            if size > MAX_FILE_SIZE:
+                return False, "Request Entity Too Large"
+            file_id = f"stub-{os.path.basename(path)}"
+            logger.info(f"{method}: {path} ({size} bytes)")
+            return True, self._message(params, **{media: {
+                'file_id': file_id, 'file_unique_id': file_id, 'file_size': size,
+                'duration': 0, 'width': 0, 'height': 0,
+            }})
+        if 'multipart_bytes' in params:
+            return True, self._message(params)
+        return False, f"Bad Request: method {method} is not supported by the stub"
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else PORT
+    stub = StubBotApi(port=port).start()
+    print(f"Stub Bot API server at {stub.base_url} (set LOCAL_BOT_API_URL to this). Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
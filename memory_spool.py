@@ -0,0 +1,75 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class MemorySpool:
+    """
+    Job workspaces on a RAM-backed filesystem (e.g. /dev/shm) for small downloads.
+
+    Each workspace reserves its planned size times overhead against a
+    fixed memory budget, capped at the filesystem's free space (Docker's
+    /dev/shm is only 64MB by default). Jobs above the size threshold, or
+    that would exceed the budget or the space still free, get no
+    workspace and fall back to disk.
+    """
+
+    def __init__(self, base_dir, budget, threshold, overhead=2):
+        free = shutil.disk_usage(base_dir).free
+        if free < budget:
+            logger.warning(f"Memory spool budget capped at the {free // (1024 * 1024)}MB free in {base_dir}")
+            budget = free
+        self.budget = budget
+        self.threshold = threshold
+        self.overhead = overhead
+        self.root = tempfile.mkdtemp(prefix='spool_', dir=base_dir)
+        self.used = 0
+        self.spooled = 0
+        self.fallbacks = 0
+        self._reserved = {}
+        self._lock = threading.Lock()
+        logger.info(f"Memory spool ready: {self.root} ({budget // (1024 * 1024)}MB budget)")
+
+    def reserve(self, size):
+        """Create a workspace for a job of size bytes, or return None to use disk."""
+        if not size or size > self.threshold:
+            return None
+        need = int(size * self.overhead)
+        with self._lock:
+            # Other programs can fill the filesystem too
+            if self.used + need > self.budget or need > shutil.disk_usage(self.root).free:
+                self.fallbacks += 1
+                logger.info(f"Memory spool full ({self.used}/{self.budget} bytes), using disk")
+                return None
+            job_dir = tempfile.mkdtemp(prefix='job_', dir=self.root)
+            self._reserved[job_dir] = need
+            self.used += need
+            self.spooled += 1
+            return job_dir
+
+    def release(self, path):
+        """Return the reservation of the workspace holding path (a job directory or a file in it)."""
+        with self._lock:
+            job_dir = path if path in self._reserved else os.path.dirname(path)
+            need = self._reserved.pop(job_dir, None)
+            if need is not None:
+                self.used -= need
+
+    def stats(self):
+        """Return budget usage and how many jobs were spooled or fell back to disk."""
+        with self._lock:
+            return {
+                'used': self.used,
+                'budget': self.budget,
+                'active': len(self._reserved),
+                'spooled': self.spooled,
+                'fallbacks': self.fallbacks,
+            }
+
+    def close(self):
+        """Remove the spool directory."""
+        shutil.rmtree(self.root, ignore_errors=True)
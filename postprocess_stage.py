@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import yt_dlp
+from yt_dlp import postprocessor
+
+logger = logging.getLogger(__name__)
+
+# Options that hold callables or only matter while downloading
+_DOWNLOAD_ONLY_OPTS = ('progress_hooks', 'postprocessor_hooks', 'logger')
+
+
+class PostprocessJob:
+    """A downloaded file whose yt-dlp postprocessing has not run yet."""
+
+    def __init__(self, opts, filename, info, files_to_move, postprocessors):
+        self.opts = opts
+        self.filename = filename
+        self.info = info
+        self.files_to_move = files_to_move
+        self.postprocessors = postprocessors
+
+    def has_work(self):
+        """Return True if merges, fixups or conversions are pending, not just moving files."""
+        return bool(self.postprocessors or self.opts.get('postprocessors'))
+
+    def describe(self):
+        """Name of the first postprocessor that will run, for progress reports."""
+        if self.postprocessors:
+            return self.postprocessors[0].replace('FFmpeg', '').replace('PP', '')
+        for pp in self.opts.get('postprocessors') or []:
+            return pp['key'].replace('FFmpeg', '')
+        return None
+
+
+class DeferredPostprocessYDL(yt_dlp.YoutubeDL):
+    """
+    YoutubeDL that only downloads.
+
+    Instead of running merge, fixup and conversion steps after a download,
+    it records them as a PostprocessJob in self.deferred so they can run
+    somewhere else with run_postprocess().
+    """
+
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init)
+        self.deferred = []
+
+    def post_process(self, filename, info, files_to_move=None):
+        pps = [type(pp).__name__ for pp in info.pop('__postprocessors', None) or []]
+        opts = {k: v for k, v in self.params.items() if k not in _DOWNLOAD_ONLY_OPTS}
+        job_info = {k: v for k, v in info.items() if k not in ('formats', 'thumbnails')}
+        self.deferred.append(PostprocessJob(
+            opts, filename, self.sanitize_info(job_info), dict(files_to_move or {}), pps
+        ))
+        info['filepath'] = filename
+        return info
+
+
+def run_postprocess(job):
+    """Run a deferred job's postprocessing and return the final file path."""
+    with yt_dlp.YoutubeDL(job.opts) as ydl:
+        info = dict(job.info)
+        info['__postprocessors'] = [getattr(postprocessor, name)(ydl) for name in job.postprocessors]
+        info = ydl.post_process(job.filename, info, job.files_to_move)
+        return info['filepath']
+
+
+class PostprocessStage:
+    """
+    Process pool for CPU-bound postprocessing (FFmpeg merges and conversions).
+
+    Keeps counters for how many jobs are waiting, running and finished so
+    the stage's queue depth can be reported separately from downloads.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._in_stage = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    async def run(self, job, on_abandoned=None):
+        """Postprocess job in the pool and return the final file path."""
+        return await self.call(run_postprocess, job, on_abandoned=on_abandoned)
+
+    async def call(self, fn, *args, on_abandoned=None):
+        """
+        Run another CPU-bound function in the pool, counted in the stage's metrics.
+
+        If the caller is cancelled, on_abandoned is called from a pool
+        thread once the pool has stopped working on the call, so the
+        caller can remove files the call may still have been writing.
+        """
+        self._in_stage += 1
+        started = time.monotonic()
+        future = self._pool.submit(fn, *args)
+        try:
+            result = await asyncio.wrap_future(future)
+            self.completed += 1
+            return result
+        except asyncio.CancelledError:
+            # A call that already started runs to the end in its process
+            if on_abandoned:
+                future.add_done_callback(lambda _: on_abandoned())
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._in_stage -= 1
+            self.busy_seconds += time.monotonic() - started
+
+    def stats(self):
+        """Return queue depth and throughput counters."""
+        running = min(self._in_stage, self.max_workers)
+        finished = self.completed + self.failed
+        return {
+            'workers': self.max_workers,
+            'running': running,
+            'queued': self._in_stage - running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_seconds': self.busy_seconds / finished if finished else 0.0,
+        }
+
+    def shutdown(self, wait=False):
+        """Stop the pool."""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+def format_bytes(num):
+    """Format a byte count for display."""
+    if num is None:
+        return "?"
+    if num < 1024 * 1024:
+        return f"{num / 1024:.0f}KB"
+    return f"{num / 1024 / 1024:.1f}MB"
+
+
+def format_progress(progress):
+    """Build a status line from a progress dict sent by download_video."""
+    if progress.get('phase') == 'postprocess':
+        name = progress.get('postprocessor') or ''
+        if name == 'Merger':
+            return "⚙️ Merging video and audio..."
+        if name == 'ExtractAudio':
+            return "🎵 Converting audio..."
+        return "⚙️ Processing file..."
+
+    downloaded = progress.get('downloaded') or 0
+    total = progress.get('total')
+    lines = []
+    if total:
+        lines.append(f"⬇️ Downloading... {downloaded / total:.0%} of {format_bytes(total)}")
+    else:
+        lines.append(f"⬇️ Downloading... {format_bytes(downloaded)}")
+
+    details = []
+    if progress.get('speed'):
+        details.append(f"🚀 {format_bytes(progress['speed'])}/s")
+    if progress.get('eta') is not None:
+        eta = int(progress['eta'])
+        details.append(f"⏳ ETA {eta // 60}:{eta % 60:02d}")
+    if details:
+        lines.append(" • ".join(details))
+    return "\n".join(lines)
+
+
+class ProgressReporter:
+    """
+    Coalesce and rate-limit status message edits.
+
+    Updates for a message only keep the latest text, and each chat gets at
+    most one edit per interval to stay under Telegram's flood limits.
+    Progress coming from worker threads is handed to the event loop with
+    threadsafe_callback().
+    """
+
+    def __init__(self, interval=3.0):
+        self.interval = interval
+        self._last_edit = {}
+        self._pending = {}
+        self._timers = {}
+        self._inflight = {}
+
+    def update(self, target, text):
+        """Schedule text for target's status message. Must be called on the event loop."""
+        key = (target.chat_id, target.message_id)
+        self._pending[key] = (target, text)
+        if key not in self._timers:
+            self._schedule(key)
+
+    def _schedule(self, key):
+        chat_id = key[0]
+        delay = max(0.0, self._last_edit.get(chat_id, 0) + self.interval - time.monotonic())
+        loop = asyncio.get_running_loop()
+        self._timers[key] = loop.call_later(delay, self._flush, key)
+
+    def _flush(self, key):
+        self._timers.pop(key, None)
+        pending = self._pending.get(key)
+        if pending is None:
+            return
+        chat_id = key[0]
+        if time.monotonic() - self._last_edit.get(chat_id, 0) < self.interval:
+            # Another message in this chat was edited in the meantime
+            self._schedule(key)
+            return
+        del self._pending[key]
+        self._last_edit[chat_id] = time.monotonic()
+        task = asyncio.get_running_loop().create_task(self._edit(*pending))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is task else None)
+
+    async def _edit(self, target, text):
+        try:
+            await target.edit_message_text(text)
+        except RetryAfter as e:
+            logger.warning(f"Progress update throttled by Telegram for {e.retry_after}s")
+            self._last_edit[target.chat_id] = time.monotonic() + e.retry_after
+        except BadRequest:
+            # Message unchanged or deleted
+            pass
+        except Exception as e:
+            logger.error(f"Progress update error: {e}")
+
+    async def finish(self, target):
+        """
+        Drop pending updates for target and wait for any edit in flight.
+
+        Call this before a final status edit so a late progress update
+        cannot overwrite it.
+        """
+        key = (target.chat_id, target.message_id)
+        self._pending.pop(key, None)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        task = self._inflight.get(key)
+        if task is not None:
+            await asyncio.wait({task})
+
+    def threadsafe_callback(self, target, loop=None):
+        """Return a callable that reports download_video progress from any thread."""
+        loop = loop or asyncio.get_running_loop()
+
+        def callback(progress):
+            try:
+                loop.call_soon_threadsafe(self.update, target, format_progress(progress))
+            except RuntimeError:
+                # Event loop closed
+                pass
+
+        return callback
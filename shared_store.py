@@ -0,0 +1,134 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteStore:
+    """
+    Key/value store with expiry in a SQLite file.
+
+    Several processes on one host can open the same file, which is enough
+    to run multiple bot front-ends behind a reverse proxy on that host.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            )
+        """)
+        self._conn.commit()
+        logger.info(f"Shared store opened: {db_path}")
+
+    def get(self, key):
+        """Return the value stored under key, or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, expiring after ttl seconds if given."""
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+            )
+            self._conn.commit()
+
+    def add(self, key, value, ttl=None):
+        """Store value only if key is missing or expired. Returns True if it was stored."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None)
+            )
+            self._conn.commit()
+            return cursor.rowcount == 1
+
+    def delete(self, key):
+        """Remove key."""
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def purge_expired(self):
+        """Delete expired keys. Returns the number removed."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM kv WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class RedisStore:
+    """
+    Key/value store with expiry on a Redis-compatible server (Redis, Valkey, KeyDB).
+
+    Lets bot front-ends on different hosts share state. Needs the redis
+    package (pip install redis); any client with the redis-py interface,
+    such as fakeredis, can be passed in instead of a URL.
+    """
+
+    def __init__(self, url=None, client=None, prefix="ytbot:"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self.prefix = prefix
+        logger.info(f"Shared store connected: {url or type(client).__name__}")
+
+    def get(self, key):
+        """Return the value stored under key, or None if missing or expired."""
+        value = self._client.get(self.prefix + key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, expiring after ttl seconds if given."""
+        self._client.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        """Store value only if key is missing or expired. Returns True if it was stored."""
+        return bool(self._client.set(self.prefix + key, value, nx=True, px=int(ttl * 1000) if ttl else None))
+
+    def delete(self, key):
+        """Remove key."""
+        self._client.delete(self.prefix + key)
+
+    def purge_expired(self):
+        """Expiry is handled by the server."""
+        return 0
+
+    def close(self):
+        """Close the connection."""
+        self._client.close()
+
+
+def is_redis_url(url):
+    """Return True for URLs of a Redis-compatible server."""
+    return url.startswith(('redis://', 'rediss://', 'unix://'))
+
+
+def open_store(url):
+    """Open a store from a URL: redis://, rediss:// or unix:// for Redis, otherwise a SQLite path."""
+    if is_redis_url(url):
+        return RedisStore(url)
+    if url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return SqliteStore(url)
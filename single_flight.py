@@ -0,0 +1,94 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One in-flight job and the number of requesters holding its result."""
+
+    def __init__(self, task):
+        self.task = task
+        self.refs = 0
+        self.cleaned_up = False
+
+
+class SingleFlight:
+    """
+    Coalesce identical in-flight jobs so they only run once.
+
+    The first requester for a key starts the job; later requesters for the
+    same key attach to it and receive the same result. Every requester gets
+    a release callable, and cleanup(result) runs once the last of them has
+    released it, e.g. to delete a shared download.
+    """
+
+    def __init__(self, cleanup=None):
+        self._cleanup = cleanup
+        self._calls = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def in_flight(self):
+        """Return the number of distinct jobs currently running."""
+        return len(self._calls)
+
+    async def acquire(self, key, fn):
+        """
+        Run fn() for key, or attach to the run already in flight.
+
+        Returns (result, release). A requester that is cancelled while
+        waiting detaches without cancelling the shared job unless it was the
+        last one waiting.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.started += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Attached to in-flight job: {key}")
+
+        call.refs += 1
+        try:
+            result = await asyncio.shield(call.task)
+        except BaseException:
+            self._release(call)
+            raise
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self._release(call)
+
+        return result, release
+
+    def _forget(self, key, call):
+        """Stop new requesters from attaching to a finished job."""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _release(self, call):
+        """Drop one reference and clean up after the last one."""
+        call.refs -= 1
+        if call.refs > 0:
+            return
+        if not call.task.done():
+            # Nobody is waiting for the result any more
+            call.task.cancel()
+            # Collect its exception so it is not reported as never retrieved
+            call.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            return
+        if call.cleaned_up or call.task.cancelled() or call.task.exception() is not None:
+            return
+        call.cleaned_up = True
+        if self._cleanup:
+            try:
+                self._cleanup(call.task.result())
+            except Exception as e:
+                logger.error(f"Single-flight cleanup error: {e}")
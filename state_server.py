@@ -0,0 +1,151 @@
+import hmac
+import json
+import logging
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Worker-Token'
+REQUEST_TIMEOUT = 10  # Seconds a worker waits for the front-end
+
+
+class StateServer:
+    """
+    HTTP access to a front-end's shared store and download queue.
+
+    Lets download workers on other hosts claim jobs, report how they
+    finished and send heartbeats without opening the SQLite files
+    themselves. Every request must carry the token, which is required.
+
+    The server speaks plain HTTP: keep it on a loopback or private
+    address and put a TLS reverse proxy in front of it for workers on
+    other hosts, so the token and the jobs' URLs are not sent in clear.
+    """
+
+    def __init__(self, store, queue, host, port, token):
+        if not token:
+            raise ValueError("A state server needs a token")
+        self.store = store
+        self.queue = queue
+        self.token = token
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.address = f"http://{host}:{self._server.server_address[1]}"
+
+    def start(self):
+        """Serve in a background thread."""
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logger.info(f"State server listening on {self.address}")
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, request):
+        if not hmac.compare_digest(request.headers.get(TOKEN_HEADER, ''), self.token):
+            self._reply(request, 403, {'error': 'bad token'})
+            return
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+            params = json.loads(request.rfile.read(length) or b'{}')
+            self._reply(request, 200, self._answer(request.path, params))
+        except KeyError as e:
+            self._reply(request, 404, {'error': f"unknown call {e}"})
+        except Exception as e:
+            logger.error(f"State server error on {request.path}: {e}")
+            self._reply(request, 500, {'error': str(e)})
+
+    def _answer(self, path, params):
+        """Run one store or queue call and return its JSON result."""
+        if path == '/store/get':
+            return {'value': self.store.get(params['key'])}
+        if path == '/store/set':
+            self.store.set(params['key'], params['value'], params.get('ttl'))
+            return {}
+        if path == '/store/add':
+            return {'added': self.store.add(params['key'], params['value'], params.get('ttl'))}
+        if path == '/store/delete':
+            self.store.delete(params['key'])
+            return {}
+        if path == '/queue/claim':
+            return {'job': self.queue.claim_next(owner=params['owner'])}
+        if path == '/queue/finish':
+            return {'finished': self.queue.finish(params['job_id'], params['status'], params['owner'])}
+        raise KeyError(path)
+
+    def _reply(self, request, status, result):
+        body = json.dumps(result).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+class _Client:
+    def __init__(self, url, token=None):
+        self.url = url.rstrip('/')
+        self._session = requests.Session()
+        if token:
+            self._session.headers[TOKEN_HEADER] = token
+
+    def _call(self, path, **params):
+        response = self._session.post(f"{self.url}{path}", json=params, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        """Close the HTTP session."""
+        self._session.close()
+
+
+class RemoteStore(_Client):
+    """A front-end's shared store used through its StateServer."""
+
+    def get(self, key):
+        return self._call('/store/get', key=key)['value']
+
+    def set(self, key, value, ttl=None):
+        self._call('/store/set', key=key, value=value, ttl=ttl)
+
+    def add(self, key, value, ttl=None):
+        return self._call('/store/add', key=key, value=value, ttl=ttl)['added']
+
+    def delete(self, key):
+        self._call('/store/delete', key=key)
+
+    def purge_expired(self):
+        """Expiry is handled by the front-end."""
+        return 0
+
+
+class RemoteQueue(_Client):
+    """A front-end's download queue used through its StateServer, claiming jobs as owner."""
+
+    def __init__(self, url, owner, token=None):
+        super().__init__(url, token)
+        self.owner = owner
+
+    def claim_next(self):
+        return self._call('/queue/claim', owner=self.owner)['job']
+
+    def finish(self, job_id, status='done'):
+        return self._call('/queue/finish', job_id=job_id, status=status, owner=self.owner)['finished']
+
+    def recover(self, is_alive=None):
+        """Jobs of stopped workers are requeued by the front-end."""
+        return 0
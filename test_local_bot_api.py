@@ -0,0 +1,57 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+import yt_downloader_bot as bot
+from file_id_cache import FileIdCache
+from local_bot_api_stub import StubBotApi
+
+
+class LocalBotApiUploadTest(unittest.TestCase):
+    """Uploads through a local Bot API server pass the file's path instead of its bytes."""
+
+    def setUp(self):
+        self.stub = StubBotApi(port=0).start()
+        self.addCleanup(self.stub.stop)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, True)
+        self.file_path = os.path.join(self.tmp, "clip.mp4")
+        with open(self.file_path, 'wb') as file:
+            file.write(os.urandom(64 * 1024))
+
+        for name, value in (('LOCAL_BOT_API_URL', self.stub.base_url),
+                            ('LOCAL_BOT_API_FILE_URL', self.stub.base_file_url),
+                            ('file_id_cache', FileIdCache(os.path.join(self.tmp, "cache.sqlite3")))):
+            self.addCleanup(setattr, bot, name, getattr(bot, name))
+            setattr(bot, name, value)
+        self.addCleanup(bot.file_id_cache.close)
+
+    def send(self, cache_key):
+        async def run():
+            async with bot.build_bot() as client:
+                return await bot.send_file_to_chat(
+                    42, self.file_path, False, client, cache_key=cache_key, release=lambda: None
+                )
+        return asyncio.run(run())
+
+    def test_upload_sends_path(self):
+        self.assertTrue(self.send(('clip', 'best', False)))
+
+        method, params = next(call for call in self.stub.calls if call[0] == 'sendVideo')
+        self.assertEqual(params['video'], f"file://{self.file_path}")
+        self.assertNotIn('multipart_bytes', params)
+        self.assertEqual(bot.file_id_cache.get('clip', 'best', False), "stub-clip.mp4")
+
+    def test_missing_file_reports_failure(self):
+        os.remove(self.file_path)
+        self.assertFalse(self.send(None))
+
+        methods = [method for method, _ in self.stub.calls]
+        self.assertNotIn('sendVideo', methods)
+        self.assertIn('sendMessage', methods)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+
+from download_queue import RedisQueue
+from shared_store import RedisStore
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipUnless(fakeredis, "needs fakeredis")
+class RedisQueueTest(unittest.TestCase):
+    """The Redis queue on a Redis stand-in, including changes that race with another host."""
+
+    def setUp(self):
+        server = fakeredis.FakeServer()
+        self.queue = RedisQueue(client=fakeredis.FakeRedis(server=server), owner='a')
+        # Another front-end sharing the same server
+        self.other = RedisQueue(client=fakeredis.FakeRedis(server=server), owner='b')
+
+    def enqueue(self, queue, user_id, url):
+        return queue.enqueue(user_id, user_id, 1, 'video', url)
+
+    def race(self, change):
+        """Run change() once, between the next transaction's reads and its MULTI."""
+        transaction = self.queue._transaction
+
+        def racing(fn):
+            self.queue._transaction = transaction
+            pending = [change]
+
+            def wrapped(pipe):
+                multi = pipe.multi
+
+                def interleaved():
+                    pipe.multi = multi
+                    if pending:
+                        pending.pop()()
+                    multi()
+
+                pipe.multi = interleaved
+                return fn(pipe)
+
+            return transaction(wrapped)
+
+        self.queue._transaction = racing
+
+    def test_claims_in_order_and_finishes(self):
+        first = self.enqueue(self.queue, 1, 'https://youtu.be/one')
+        self.enqueue(self.other, 2, 'https://youtu.be/two')
+
+        job = self.queue.claim_next()
+        self.assertEqual((job['id'], job['status'], job['owner']), (first, 'running', 'a'))
+        self.assertEqual(self.other.claim_next()['url'], 'https://youtu.be/two')
+        self.assertIsNone(self.queue.claim_next())
+
+        self.queue.finish(first)
+        self.assertEqual(self.other.depth(), {'pending': 0, 'running': 1})
+
+    def test_claim_sees_job_enqueued_during_it(self):
+        first = self.enqueue(self.queue, 1, 'https://youtu.be/one')
+        second = []
+        self.race(lambda: second.append(self.enqueue(self.other, 1, 'https://youtu.be/two')))
+
+        self.assertEqual(self.queue.claim_next()['id'], first)
+        self.assertEqual(self.queue.depth(), {'pending': 1, 'running': 1})
+        self.assertEqual(self.queue.claim_next()['id'], second[0])
+
+    def test_cancel_sees_job_enqueued_during_it(self):
+        self.enqueue(self.queue, 1, 'https://youtu.be/one')
+        second = []
+        self.race(lambda: second.append(self.enqueue(self.other, 1, 'https://youtu.be/two')))
+
+        self.assertEqual(self.queue.cancel_user(1), 2)
+        self.assertEqual(self.queue._job(second[0])['status'], 'cancelled')
+        self.assertEqual(self.queue.depth()['pending'], 0)
+
+    def test_recover_requeues_dead_owner(self):
+        job_id = self.enqueue(self.queue, 1, 'https://youtu.be/one')
+        self.other.claim_next()
+
+        self.assertEqual(self.queue.recover(lambda owner: owner == 'a'), 1)
+        self.assertEqual(self.queue.claim_next()['id'], job_id)
+
+    def test_finish_by_previous_owner_is_ignored(self):
+        job_id = self.enqueue(self.queue, 1, 'https://youtu.be/one')
+        self.other.claim_next()
+        self.queue.recover(lambda owner: False)
+        self.queue.claim_next()
+
+        self.assertFalse(self.other.finish(job_id, 'failed'))
+        self.assertEqual(self.queue._job(job_id)['status'], 'running')
+        self.assertEqual(self.queue.depth()['running'], 1)
+        self.assertTrue(self.queue.finish(job_id))
+        self.assertEqual(self.queue.depth()['running'], 0)
+
+
+@unittest.skipUnless(fakeredis, "needs fakeredis")
+class RedisStoreTest(unittest.TestCase):
+    def test_add_only_stores_missing_keys(self):
+        store = RedisStore(client=fakeredis.FakeRedis())
+        self.assertTrue(store.add('url:abc', 'one', ttl=60))
+        self.assertFalse(store.add('url:abc', 'two', ttl=60))
+        self.assertEqual(store.get('url:abc'), 'one')
+
+        store.delete('url:abc')
+        self.assertIsNone(store.get('url:abc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update):
+    """Return the chat an update belongs to, or None for updates without one."""
+    chat = getattr(update, 'effective_chat', None)
+    if chat:
+        return chat.id
+    user = getattr(update, 'effective_user', None)
+    return ('user', user.id) if user else None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates concurrently across chats but one at a time within a chat.
+
+    Each chat gets an asyncio.Lock while it has updates in flight, so a
+    slow handler in one chat never delays another chat while messages and
+    button presses from the same chat still run in the order they arrived.
+    Up to max_pending updates are admitted at once; only
+    max_concurrent_updates of them run handlers; the rest wait on their
+    chat's lock without holding a handler slot, so a flood from one chat
+    cannot starve the others. Updates for which bypass(update) is true skip
+    the chat lock (e.g. /cancel, which must not wait behind the work it
+    cancels).
+    """
+
+    def __init__(self, max_concurrent_updates, max_pending=None, bypass=None):
+        super().__init__(max(max_pending or 0, max_concurrent_updates))
+        self.running_limit = max_concurrent_updates
+        self.bypass = bypass
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chats = {}  # chat key -> [lock, updates holding or waiting for it]
+        self.processed = 0
+        self.max_waiting = 0
+
+    async def do_process_update(self, update, coroutine):
+        key = chat_key(update)
+        if key is None or (self.bypass and self.bypass(update)):
+            await self._run(coroutine)
+            return
+
+        entry = self._chats.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        self.max_waiting = max(self.max_waiting, entry[1] - 1)
+        try:
+            async with entry[0]:
+                await self._run(coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[key]
+
+    async def _run(self, coroutine):
+        async with self._running:
+            await coroutine
+            self.processed += 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        """Return how many chats have updates in flight and how many updates were processed."""
+        return {
+            'limit': self.running_limit,
+            'pending_limit': self.max_concurrent_updates,
+            'active_chats': len(self._chats),
+            'waiting': sum(count - 1 for _, count in self._chats.values()),
+            'max_waiting': self.max_waiting,
+            'processed': self.processed,
+        }
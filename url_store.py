@@ -0,0 +1,132 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class UrlStore:
+    """
+    Bounded mapping from callback URL hashes to URLs.
+
+    Keeps recently used URLs in an in-memory LRU limited by entry count and
+    total URL size, expires entries a TTL after they were stored, and
+    optionally writes them through to SQLite so keyboards sent before a
+    restart keep working. With a shared store (see shared_store.py) the
+    write-through goes there instead, so a button press can be answered by
+    a different bot process than the one that sent the keyboard.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=4 * 1024 * 1024, ttl=7 * 24 * 3600, db_path=None, store=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._shared = store
+
+        if db_path and store is None:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    url_hash TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+            removed = self.purge_expired()
+            logger.info(f"URL store opened: {db_path} ({removed} expired entries removed)")
+
+    def get(self, url_hash):
+        """Return the URL for a hash, or None if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url_hash)
+            if entry is not None:
+                url, created_at = entry
+                if now - created_at <= self.ttl:
+                    self._entries.move_to_end(url_hash)
+                    return url
+                self._remove(url_hash)
+
+            if self._shared is not None:
+                value = self._shared.get(f"url:{url_hash}")
+                if value:
+                    url, created_at = json.loads(value)
+                    self._store(url_hash, url, created_at)
+                    return url
+            elif self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT url, created_at FROM urls WHERE url_hash = ? AND created_at >= ?",
+                    (url_hash, now - self.ttl)
+                ).fetchone()
+                if row:
+                    self._store(url_hash, row[0], row[1])
+                    return row[0]
+            return None
+
+    def put(self, url_hash, url):
+        """Remember the URL behind a hash."""
+        now = time.time()
+        with self._lock:
+            self._store(url_hash, url, now)
+            if self._shared is not None:
+                try:
+                    self._shared.set(f"url:{url_hash}", json.dumps([url, now]), ttl=self.ttl)
+                except Exception as e:
+                    logger.error(f"URL store write error: {e}")
+            elif self._conn is not None:
+                try:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO urls (url_hash, url, created_at) VALUES (?, ?, ?)",
+                        (url_hash, url, now)
+                    )
+                    self._conn.commit()
+                except Exception as e:
+                    logger.error(f"URL store write error: {e}")
+
+    def _store(self, url_hash, url, created_at):
+        """Insert into the in-memory LRU and evict until within bounds."""
+        self._remove(url_hash)
+        self._entries[url_hash] = (url, created_at)
+        self._bytes += len(url)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, url_hash):
+        entry = self._entries.pop(url_hash, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def purge_expired(self):
+        """Delete expired entries from disk. Returns the number removed."""
+        if self._conn is None:
+            return 0
+        cursor = self._conn.execute("DELETE FROM urls WHERE created_at < ?", (time.time() - self.ttl,))
+        self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self):
+        """Return in-memory size and eviction counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'evictions': self.evictions,
+            }
+
+    def close(self):
+        """Close the SQLite connection, if any."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
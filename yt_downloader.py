@@ -3,31 +3,74 @@ import os
 import subprocess
 import platform
 import urllib.parse
+import json
+import time
+import argparse
+from download_index import DownloadIndex
+from batch_manifest import BatchManifest, BATCH_MODES, parse_batch_line
+from ytdl_engine import (
+    DownloadEngine, ytdlp_version, AUDIO_FORMATS,
+    PROFILE_VIDEO, PROFILE_AUDIO, PROFILE_PLAYLIST_VIDEO, PROFILE_PLAYLIST_AUDIO
+)
 
 # --- Configuration ---
 VIDEO_URL = "https://www.youtube.com/watch?v=-1GB6m39-rM"
 DOWNLOAD_PATH = "D:/z_material/JAVA" 
 FFMPEG_PATH = "E://ffmpeg"  
 MAX_HEIGHT = "1080"  
+PARALLEL_WORKERS = 4  # Worker processes per playlist (1 = download one video at a time)
+CONCURRENT_FRAGMENTS = 4  # Fragments downloaded in parallel per video
+AUDIO_FORMAT = "native"  # "native" keeps the source m4a/opus stream, "mp3" re-encodes everything
+VERSION_STAMP_PATH = os.path.join(os.path.expanduser("~"), ".yt_downloader_version.json")
+VERSION_CHECK_TTL = 24 * 3600  # Seconds a cached yt-dlp version is trusted
+UPDATE_INTERVAL = 7 * 24 * 3600  # Seconds between background yt-dlp upgrades (0 = never)
+BATCH_MANIFEST_NAME = "batch_manifest.sqlite3"  # Default manifest, kept in the download path
+DOWNLOAD_INDEX_NAME = "download_index.sqlite3"  # Index of downloaded videos, kept in the download path
+
+# Batch mode -> (download profile, subfolder)
+BATCH_PROFILES = {
+    "video": (PROFILE_VIDEO, ""),
+    "audio": (PROFILE_AUDIO, ""),
+    "playlist-video": (PROFILE_PLAYLIST_VIDEO, "Playlist_Videos"),
+    "playlist-audio": (PROFILE_PLAYLIST_AUDIO, "Playlist_Audio"),
+}
+
+# Background pip upgrade started at launch, if one was due
+_update_process = None
+
+def load_stamp():
+    """Read the cached version/update stamp."""
+    try:
+        with open(VERSION_STAMP_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_stamp(stamp):
+    """Write the cached version/update stamp."""
+    try:
+        with open(VERSION_STAMP_PATH, "w", encoding="utf-8") as f:
+            json.dump(stamp, f)
+    except OSError as e:
+        print(f"Warning: Could not write {VERSION_STAMP_PATH}: {e}")
 
 def check_requirements():
-    """Check if yt-dlp is installed and available."""
+    """Check if yt-dlp is installed, trusting a recent cached version stamp."""
+    stamp = load_stamp()
+    if stamp.get("version") and time.time() - stamp.get("checked_at", 0) < VERSION_CHECK_TTL:
+        print(f"yt-dlp version: {stamp['version']}")
+        return True
+    
     try:
-        result = subprocess.run(
-            ["yt-dlp", "--version"], 
-            stdout=subprocess.PIPE, 
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        if result.returncode == 0:
-            print(f"yt-dlp version: {result.stdout.strip()}")
-            return True
-        else:
-            print("yt-dlp not found. Please install it with: pip install yt-dlp")
-            return False
-    except FileNotFoundError:
+        version = ytdlp_version()
+    except Exception:
         print("yt-dlp not found. Please install it with: pip install yt-dlp")
         return False
+    
+    print(f"yt-dlp version: {version}")
+    stamp.update(version=version, checked_at=time.time())
+    save_stamp(stamp)
+    return True
 
 def update_ytdlp():
     """Update yt-dlp to the latest version using pip."""
@@ -37,6 +80,10 @@ def update_ytdlp():
                               capture_output=True, text=True)
         if result.returncode == 0:
             print("yt-dlp updated successfully")
+            # Re-read the version on next launch
+            stamp = load_stamp()
+            stamp.update(checked_at=0, updated_at=time.time())
+            save_stamp(stamp)
             return True
         else:
             print("Failed to update yt-dlp with pip")
@@ -46,6 +93,39 @@ def update_ytdlp():
         print(f"Error updating yt-dlp: {e}")
         return False
 
+def start_background_update():
+    """Start a quiet pip upgrade of yt-dlp if the last one is older than UPDATE_INTERVAL."""
+    global _update_process
+    stamp = load_stamp()
+    if not UPDATE_INTERVAL or time.time() - stamp.get("updated_at", 0) < UPDATE_INTERVAL:
+        return
+    
+    try:
+        _update_process = subprocess.Popen(
+            [sys.executable, "-m", "pip", "install", "--quiet", "--upgrade", "yt-dlp"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    except OSError as e:
+        print(f"Warning: Could not start yt-dlp update: {e}")
+        return
+    
+    # Record the attempt now so an interrupted session does not retry on every launch
+    stamp.update(checked_at=0, updated_at=time.time())
+    save_stamp(stamp)
+    print("Updating yt-dlp in the background...")
+
+def wait_for_update():
+    """Wait for a running background update so yt_dlp is not imported mid-install."""
+    global _update_process
+    if _update_process is None:
+        return
+    if _update_process.poll() is None:
+        print("Waiting for the yt-dlp update to finish...")
+        _update_process.wait()
+    if _update_process.returncode != 0:
+        print("Warning: Could not update yt-dlp. Continuing with current version...")
+    _update_process = None
+
 def validate_url(url):
     """Validate that the URL is a proper YouTube URL."""
     try:
@@ -58,165 +138,284 @@ def validate_url(url):
         print(f"Invalid URL format: {url}")
         return False
 
+# Long-lived download engine, reused across menu iterations
+_engine = None
+
+def get_engine(ffmpeg_path="", max_height="1080", audio_format=AUDIO_FORMAT):
+    """Return the shared download engine, recreating it if its settings change."""
+    global _engine
+    wait_for_update()
+    settings = (ffmpeg_path, max_height, audio_format)
+    if _engine is None or (_engine.ffmpeg_path, _engine.max_height, _engine.audio_format) != settings:
+        if _engine is not None:
+            _engine.close()
+        _engine = DownloadEngine(ffmpeg_path, max_height, CONCURRENT_FRAGMENTS, audio_format=audio_format)
+    return _engine
+
+def print_result(result, download_type):
+    """Print the files and timing of a download result."""
+    for file in result['files']:
+        duration = file['duration']
+        duration_str = f"{int(duration)//60}:{int(duration)%60:02d}" if duration else "?"
+        print(f"  {os.path.basename(file['path'])} ({file['size']/1024/1024:.1f}MB, {duration_str})")
+    
+    if result['error']:
+        print(f"\nAn error occurred during {download_type}: {result['error']}")
+    elif result['success']:
+        print(f"\n{download_type} completed successfully in {result['elapsed']:.1f}s!")
+    else:
+        print(f"\n{download_type} finished with {result['failed']} failed download(s)")
+    return result['success']
+
+def run_profile(url, profile, output_path, download_type, ffmpeg_path="", max_height="1080",
+                audio_format=AUDIO_FORMAT):
+    """Download url with a profile using the shared engine."""
+    print(f"\n=== {download_type} ===")
+    print("\nDownload progress:")
+    result = get_engine(ffmpeg_path, max_height, audio_format).download(url, profile, output_path)
+    return print_result(result, download_type)
+
 def download_single_video(url, output_path, ffmpeg_path="", max_height="1080"):
     """Download a single video with audio in best quality up to specified height."""
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-    
-    output_template = os.path.join(output_path, "%(title)s [%(id)s].%(ext)s")
-    output_template = output_template.replace("\\", "/")
-    
-    cmd = ["yt-dlp"]
-    
-    if ffmpeg_path:
-        cmd.extend(["--ffmpeg-location", ffmpeg_path])
-    
-    # Format selection for best video+audio up to max height
-    format_selector = f"bestvideo[height<={max_height}]+bestaudio/best[height<={max_height}]"
-    
-    cmd.extend([
-        "-f", format_selector,
-        "-o", output_template,
-        "--no-playlist",
-        "--ignore-errors",
-        "--embed-subs",
-        "--write-auto-sub",
-        "--merge-output-format", "mp4",
-        url
-    ])
-    
-    return execute_download(cmd, "Single Video Download")
+    return run_profile(url, PROFILE_VIDEO, output_path, "Single Video Download", ffmpeg_path, max_height)
 
-def download_single_audio(url, output_path, ffmpeg_path=""):
+def download_single_audio(url, output_path, ffmpeg_path="", audio_format=AUDIO_FORMAT):
     """Download only audio from a single video."""
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-    
-    output_template = os.path.join(output_path, "%(title)s [%(id)s].%(ext)s")
-    output_template = output_template.replace("\\", "/")
-    
-    cmd = ["yt-dlp"]
-    
-    if ffmpeg_path:
-        cmd.extend(["--ffmpeg-location", ffmpeg_path])
-    
-    cmd.extend([
-        "-f", "bestaudio/best",
-        "-o", output_template,
-        "--no-playlist",
-        "--ignore-errors",
-        "--extract-audio",
-        "--audio-format", "mp3",
-        "--audio-quality", "0",  # Best quality
-        url
-    ])
-    
-    return execute_download(cmd, "Single Audio Download")
+    return run_profile(url, PROFILE_AUDIO, output_path, "Single Audio Download", ffmpeg_path,
+                       audio_format=audio_format)
 
-def download_playlist_videos(url, output_path, ffmpeg_path="", max_height="1080"):
-    """Download all videos from a playlist with audio."""
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-    
+def download_playlist_videos(url, output_path, ffmpeg_path="", max_height="1080", workers=1):
+    """Download the videos of a playlist with audio, skipping ones already downloaded."""
     # Create playlist subfolder
     playlist_path = os.path.join(output_path, "Playlist_Videos")
-    if not os.path.exists(playlist_path):
-        os.makedirs(playlist_path)
-    
-    output_template = os.path.join(playlist_path, "%(playlist_index)02d - %(title)s [%(id)s].%(ext)s")
-    output_template = output_template.replace("\\", "/")
-    
-    cmd = ["yt-dlp"]
-    
-    if ffmpeg_path:
-        cmd.extend(["--ffmpeg-location", ffmpeg_path])
-    
-    format_selector = f"bestvideo[height<={max_height}]+bestaudio/best[height<={max_height}]"
-    
-    cmd.extend([
-        "-f", format_selector,
-        "-o", output_template,
-        "--yes-playlist",
-        "--ignore-errors",
-        "--embed-subs",
-        "--write-auto-sub",
-        "--merge-output-format", "mp4",
-        url
-    ])
-    
-    return execute_download(cmd, "Playlist Video Download")
+    index_path = os.path.join(output_path, DOWNLOAD_INDEX_NAME)
+    return sync_playlist(url, playlist_path, False, ffmpeg_path, max_height, workers, index_path)
 
-def download_playlist_audio(url, output_path, ffmpeg_path=""):
-    """Download only audio from all videos in a playlist."""
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-    
+def download_playlist_audio(url, output_path, ffmpeg_path="", workers=1, audio_format=AUDIO_FORMAT):
+    """Download only the audio of a playlist's videos, skipping ones already downloaded."""
     # Create playlist audio subfolder
     playlist_path = os.path.join(output_path, "Playlist_Audio")
-    if not os.path.exists(playlist_path):
-        os.makedirs(playlist_path)
-    
-    output_template = os.path.join(playlist_path, "%(playlist_index)02d - %(title)s [%(id)s].%(ext)s")
-    output_template = output_template.replace("\\", "/")
-    
-    cmd = ["yt-dlp"]
-    
-    if ffmpeg_path:
-        cmd.extend(["--ffmpeg-location", ffmpeg_path])
+    index_path = os.path.join(output_path, DOWNLOAD_INDEX_NAME)
+    return sync_playlist(url, playlist_path, True, ffmpeg_path, workers=workers, index_path=index_path,
+                         audio_format=audio_format)
+
+# Per-process engine used by parallel playlist workers
+_worker_engine = None
+
+def get_worker_engine(ffmpeg_path, max_height, audio_format):
+    """Return this worker process's download engine."""
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = DownloadEngine(ffmpeg_path, max_height, CONCURRENT_FRAGMENTS, quiet=True,
+                                        audio_format=audio_format)
+    return _worker_engine
+
+def download_entry_worker(entry, playlist_path, profile, ffmpeg_path, max_height, audio_format):
+    """Download one playlist entry inside a worker process."""
+    engine = get_worker_engine(ffmpeg_path, max_height, audio_format)
+    return entry, engine.download(entry['url'], profile, playlist_path, playlist_template(entry))
+
+def download_batch_worker(item, output_path, ffmpeg_path, max_height, audio_format):
+    """Download one batch item inside a worker process."""
+    profile, subfolder = BATCH_PROFILES[item['mode']]
+    path = os.path.join(output_path, subfolder) if subfolder else output_path
+    result = get_worker_engine(ffmpeg_path, max_height, audio_format).download(item['url'], profile, path)
+    return item, result
+
+def read_batch(source, default_mode="video"):
+    """Read (url, mode) pairs from a batch file, or stdin if source is '-'."""
+    items = []
+    f = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    try:
+        for line_no, line in enumerate(f, start=1):
+            try:
+                item = parse_batch_line(line, default_mode)
+            except ValueError as e:
+                print(f"Line {line_no}: {e}, skipped")
+                continue
+            if item is None:
+                continue
+            if not validate_url(item[0]):
+                print(f"Line {line_no}: skipped")
+                continue
+            items.append(item)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return items
+
+def run_batch(source, output_path, ffmpeg_path="", max_height="1080", workers=PARALLEL_WORKERS,
+              manifest_path=None, default_mode="video", retry_failed=False, audio_format=AUDIO_FORMAT):
+    """
+    Download every URL in a batch file with a pool of worker processes.
+
+    Results are recorded in a manifest, so running the same batch again
+    only downloads what is still pending (and failed items with retry_failed).
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
     
-    cmd.extend([
-        "-f", "bestaudio/best",
-        "-o", output_template,
-        "--yes-playlist",
-        "--ignore-errors",
-        "--extract-audio",
-        "--audio-format", "mp3",
-        "--audio-quality", "0",  # Best quality
-        url
-    ])
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    manifest_path = manifest_path or os.path.join(output_path, BATCH_MANIFEST_NAME)
+    manifest = BatchManifest(manifest_path)
     
-    return execute_download(cmd, "Playlist Audio Download")
+    try:
+        added = manifest.add(read_batch(source, default_mode))
+        if retry_failed:
+            print(f"Retrying {manifest.retry_failed()} failed item(s)")
+        pending = manifest.pending()
+        summary = manifest.summary()
+        print(f"\n=== Batch Download ===")
+        print(f"Manifest: {os.path.abspath(manifest_path)}")
+        print(f"{added} new item(s), {len(pending)} to download, {summary['done']} already done, "
+              f"{summary['failed']} failed earlier. Using {workers} workers.\n")
+        if not pending:
+            return summary['failed'] == 0
+        
+        wait_for_update()
+        total = len(pending)
+        completed = 0
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = []
+            for item in pending:
+                manifest.start(item['id'])
+                futures.append(pool.submit(download_batch_worker, item, output_path, ffmpeg_path, max_height,
+                                           audio_format))
+            for future in as_completed(futures):
+                item, result = future.result()
+                completed += 1
+                paths = [file['path'] for file in result['files']]
+                manifest.finish(item['id'], result['success'], paths, result['error'])
+                if result['success']:
+                    size = sum(file['size'] for file in result['files'])
+                    status = f"done ({len(paths)} file(s), {size/1024/1024:.1f}MB in {result['elapsed']:.0f}s)"
+                else:
+                    status = f"FAILED ({result['error'] or str(result['failed']) + ' failed download(s)'})"
+                print(f"[{completed}/{total}] {item['mode']} {item['url']}: {status}")
+        except KeyboardInterrupt:
+            print("\nBatch interrupted. Run the same command again to resume.")
+            pool.shutdown(wait=False, cancel_futures=True)
+            return False
+        pool.shutdown()
+        
+        summary = manifest.summary()
+        print(f"\nBatch finished: {summary['done']} done, {summary['failed']} failed, {summary['pending']} pending")
+        return summary['failed'] == 0 and summary['pending'] == 0
+    finally:
+        manifest.close()
+
+def parse_args():
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="YouTube downloader using yt-dlp")
+    parser.add_argument("--update", action="store_true", help="upgrade yt-dlp before starting")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="download the URLs in FILE ('-' for stdin), one 'URL [mode]' per line")
+    parser.add_argument("--mode", choices=BATCH_MODES, default="video", help="mode for batch lines without one")
+    parser.add_argument("--workers", type=int, default=PARALLEL_WORKERS, help="batch worker processes")
+    parser.add_argument("--manifest", help=f"batch manifest path (default: <download path>/{BATCH_MANIFEST_NAME})")
+    parser.add_argument("--retry-failed", action="store_true", help="retry batch items that failed before")
+    parser.add_argument("--audio-format", choices=AUDIO_FORMATS, default=AUDIO_FORMAT,
+                        help="keep the source audio stream (native) or convert to mp3")
+    parser.add_argument("--output", default=DOWNLOAD_PATH, help=f"download path (default: {DOWNLOAD_PATH})")
+    return parser.parse_args()
+
+def playlist_template(entry):
+    """Output template for one playlist entry, numbered by its playlist index."""
+    return f"{entry['index']:02d} - %(title)s [%(id)s].%(ext)s"
+
+def sync_playlist(url, playlist_path, audio_only, ffmpeg_path="", max_height="1080", workers=1, index_path=None,
+                  audio_format=AUDIO_FORMAT):
+    """
+    Download the entries of a playlist that are not already on disk.
 
-def execute_download(cmd, download_type):
-    """Execute the download command and handle output."""
+    The playlist is expanded once without probing each video, diffed
+    against the local download index, and only new entries or entries
+    whose file was deleted are downloaded, in worker processes when
+    workers > 1.
+    """
+    download_type = "Playlist Audio Sync" if audio_only else "Playlist Video Sync"
+    # Each entry is downloaded as a single video, named with its playlist index
+    profile = PROFILE_AUDIO if audio_only else PROFILE_VIDEO
+    fmt = f"audio-{audio_format}" if audio_only else f"video-{max_height}"
     print(f"\n=== {download_type} ===")
-    print(f"Command: {' '.join(cmd)}")
-    print("\nDownload progress:")
+    print("Reading playlist...")
+    
+    entries = get_engine(ffmpeg_path, max_height, audio_format).expand_playlist(url)
+    if not entries:
+        print("No videos found in playlist.")
+        return False
     
+    if not os.path.exists(playlist_path):
+        os.makedirs(playlist_path)
+    index = DownloadIndex(index_path or os.path.join(playlist_path, DOWNLOAD_INDEX_NAME))
     try:
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            bufsize=1
-        )
-        
-        for line in process.stdout:
-            print(line, end='')
-        
-        process.wait()
-        
-        if process.returncode == 0:
-            print(f"\n{download_type} completed successfully!")
+        missing, present, deleted = index.diff(entries, fmt)
+        print(f"Found {len(entries)} videos: {len(present)} already downloaded, "
+              f"{len(missing) - deleted} new, {deleted} missing on disk.")
+        if not missing:
+            print(f"\n{download_type}: everything is up to date.")
             return True
-        else:
-            print(f"\n{download_type} failed with return code {process.returncode}")
-            return False
-            
-    except Exception as e:
-        print(f"\nAn error occurred during {download_type}: {e}")
+        print(f"Downloading {len(missing)} with {workers} worker(s), "
+              f"{CONCURRENT_FRAGMENTS} fragments per video.\n")
+        
+        failed = []
+        completed = 0
+        total_size = 0
+        for entry, result in download_entries(missing, playlist_path, profile, ffmpeg_path, max_height,
+                                              audio_format, workers):
+            completed += 1
+            if result['success']:
+                size = sum(file['size'] for file in result['files'])
+                total_size += size
+                for file in result['files']:
+                    index.record(file['id'] or entry['id'], fmt, file['path'])
+                status = f"done ({size/1024/1024:.1f}MB in {result['elapsed']:.0f}s)"
+            else:
+                status = "FAILED"
+                failed.append(entry)
+            print(f"[{completed}/{len(missing)}] {entry['index']:02d} - {entry['title'][:60]}: {status}")
+            if result['error']:
+                print(f"    {result['error']}")
+    finally:
+        index.close()
+    
+    if failed:
+        print(f"\n{download_type} finished with {len(failed)} failed of {len(missing)}:")
+        for entry in sorted(failed, key=lambda e: e['index']):
+            print(f"  {entry['index']:02d} - {entry['title']}")
         return False
+    
+    print(f"\n{download_type} completed successfully! ({total_size/1024/1024:.1f}MB)")
+    return True
+
+def download_entries(entries, playlist_path, profile, ffmpeg_path, max_height, audio_format, workers):
+    """Yield (entry, result) as playlist entries finish downloading."""
+    if workers <= 1:
+        engine = get_engine(ffmpeg_path, max_height, audio_format)
+        for entry in entries:
+            yield entry, engine.download(entry['url'], profile, playlist_path, playlist_template(entry))
+        return
+    
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(download_entry_worker, entry, playlist_path, profile, ffmpeg_path, max_height, audio_format)
+            for entry in entries
+        ]
+        for future in as_completed(futures):
+            yield future.result()
 
-def display_menu():
+def display_menu(audio_format=AUDIO_FORMAT):
     """Display the download options menu."""
+    audio_label = "MP3" if audio_format == "mp3" else "original format, e.g. M4A"
     print("\n" + "="*60)
     print("YouTube Downloader - Choose your option:")
     print("="*60)
     print("1. Download single video with audio (best quality)")
-    print("2. Download single video - audio only (MP3)")
+    print(f"2. Download single video - audio only ({audio_label})")
     print("3. Download playlist - all videos with audio")
-    print("4. Download playlist - audio only (MP3)")
+    print(f"4. Download playlist - audio only ({audio_label})")
     print("5. Exit")
     print("="*60)
 
@@ -253,6 +452,8 @@ def is_playlist_url(url):
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    args = parse_args()
+    DOWNLOAD_PATH = args.output
     print("--- Enhanced YouTube Video Downloader using yt-dlp ---")
     
     # Check if yt-dlp is available
@@ -260,16 +461,24 @@ if __name__ == "__main__":
         print("Please install yt-dlp and try again.")
         sys.exit(1)
     
-    # Try to update yt-dlp
-    print("\nTrying to update yt-dlp...")
-    if not update_ytdlp():
-        print("Warning: Could not update yt-dlp. Continuing with current version...")
+    # Update yt-dlp now when asked, otherwise in the background when due
+    if args.update:
+        print("\nTrying to update yt-dlp...")
+        if not update_ytdlp():
+            print("Warning: Could not update yt-dlp. Continuing with current version...")
+    else:
+        start_background_update()
+    
+    if args.batch:
+        ok = run_batch(args.batch, args.output, FFMPEG_PATH, MAX_HEIGHT, max(1, args.workers),
+                       args.manifest, args.mode, args.retry_failed, args.audio_format)
+        sys.exit(0 if ok else 1)
     
     print(f"\nDefault download path: {os.path.abspath(DOWNLOAD_PATH)}")
     print(f"Maximum video resolution: {MAX_HEIGHT}p")
     
     while True:
-        display_menu()
+        display_menu(args.audio_format)
         choice = get_user_choice()
         
         if choice == 5:
@@ -297,21 +506,21 @@ if __name__ == "__main__":
             if is_playlist_url(url):
                 print("Warning: Playlist URL detected, but downloading only the first video's audio.")
                 url += "&index=1"
-            success = download_single_audio(url, DOWNLOAD_PATH, FFMPEG_PATH)
+            success = download_single_audio(url, DOWNLOAD_PATH, FFMPEG_PATH, args.audio_format)
             
         elif choice == 3:
             # Playlist videos
             if not is_playlist_url(url):
                 print("Warning: This doesn't appear to be a playlist URL.")
                 print("If it's a single video, it will be downloaded to the playlist folder.")
-            success = download_playlist_videos(url, DOWNLOAD_PATH, FFMPEG_PATH, MAX_HEIGHT)
+            success = download_playlist_videos(url, DOWNLOAD_PATH, FFMPEG_PATH, MAX_HEIGHT, PARALLEL_WORKERS)
             
         elif choice == 4:
             # Playlist audio
             if not is_playlist_url(url):
                 print("Warning: This doesn't appear to be a playlist URL.")
                 print("If it's a single video, its audio will be downloaded to the playlist folder.")
-            success = download_playlist_audio(url, DOWNLOAD_PATH, FFMPEG_PATH)
+            success = download_playlist_audio(url, DOWNLOAD_PATH, FFMPEG_PATH, PARALLEL_WORKERS, args.audio_format)
         
         if success:
             print(f"\nDownload completed successfully!")
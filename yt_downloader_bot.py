@@ -1,4 +1,5 @@
 import os
+import argparse
 import subprocess
 import logging
 import asyncio
@@ -6,12 +7,38 @@ import sys
 import tempfile
 import shutil
 import hashlib
+import itertools
+import math
 import json
+import time
+import socket
+import urllib.parse
+from contextlib import contextmanager
 from pathlib import Path
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter, TimedOut
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+from telegram.request import HTTPXRequest
 import yt_dlp
 import requests
+from download_executor import DownloadExecutor, UserLimitError, JobTimeoutError, JobCancelledError
+from file_id_cache import FileIdCache
+from metadata_cache import MetadataCache
+from format_planner import plan_format, plan_audio, has_size_info
+from url_store import UrlStore
+from single_flight import SingleFlight
+from byte_budget import ByteBudget
+from download_queue import open_queue
+from progress_reporter import ProgressReporter
+from ytdl_engine import result_files, audio_postprocessor
+from memory_spool import MemorySpool
+from fit_to_size import fit_to_size, choose_strategy, FitError
+from postprocess_stage import PostprocessStage, PostprocessJob, DeferredPostprocessYDL, run_postprocess
+from update_processor import ChatOrderedUpdateProcessor
+from shared_store import open_store
+from state_server import StateServer, RemoteStore, RemoteQueue
+from prometheus_client import REGISTRY, Counter, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
 
 # Configure logging
 logging.basicConfig(
@@ -24,8 +51,97 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = "7777439852:AAEYhS6yZs7xB9I_vlkPmk7N2Us88aH3e4U"
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB limit for Telegram
 
+# Self-hosted Bot API server (telegram-bot-api --local). Files are passed to it
+# by path instead of being uploaded, and it accepts files up to 2000MB.
+LOCAL_BOT_API_URL = None  # e.g. "http://localhost:8081/bot"
+LOCAL_BOT_API_FILE_URL = None  # e.g. "http://localhost:8081/file/bot"
+LOCAL_BOT_API_MAX_FILE_SIZE = 2000 * 1024 * 1024
+
+# Maximum video height for each quality option (None = no limit)
+QUALITY_HEIGHTS = {'best': None, 'high': 720, 'medium': 480}
+
+# Audio handling: Telegram plays M4A and MP3, so M4A streams are sent as they
+# are and only other codecs are converted to MP3
+AUDIO_TRANSCODE = False  # True re-encodes every track to MP3
+TELEGRAM_AUDIO_EXTS = ('m4a', 'mp3')
+TELEGRAM_AUDIO_FORMAT = 'm4a>m4a/mp3'  # yt-dlp --audio-format mapping
+
+# Worker pool configuration
+WORKER_MODE = 'thread'  # 'thread' or 'process'
+MAX_WORKERS = 4  # Concurrent yt-dlp jobs across all users
+MAX_JOBS_PER_USER = 2  # Concurrent yt-dlp jobs per user
+EXTRACT_TIMEOUT = 60  # Seconds allowed for info extraction
+DOWNLOAD_TIMEOUT = 600  # Seconds allowed for a single download
+PROGRESS_INTERVAL = 3  # Minimum seconds between status edits per chat
+FIT_OVERSIZED = True  # Split or re-encode files over MAX_FILE_SIZE instead of rejecting them
+SEPARATE_POSTPROCESSING = True  # Run FFmpeg steps in their own process pool after the download
+POSTPROCESS_WORKERS = os.cpu_count() or 1  # Concurrent FFmpeg jobs
+
+# Small audio downloads are kept on a RAM-backed filesystem instead of disk
+SPOOL_DIR = "/dev/shm"  # Set to None to always use disk
+SPOOL_THRESHOLD = 10 * 1024 * 1024  # Largest planned size that is spooled
+SPOOL_BUDGET = 256 * 1024 * 1024  # Memory shared by all spooled jobs; capped at SPOOL_DIR's free space
+
+# Telegram file_id cache configuration
+FILE_ID_CACHE_PATH = "file_id_cache.sqlite3"
+FILE_ID_CACHE_TTL = 30 * 24 * 3600  # Re-upload files older than 30 days
+
+# Video/playlist info cache configuration
+METADATA_CACHE_SIZE = 256  # Max info entries kept in memory
+METADATA_CACHE_TTL = 15 * 60  # Seconds before info is extracted again
+METADATA_CACHE_PATH = None  # Set to a file path to persist info on disk
+
+# Playlist extraction configuration
+PLAYLIST_PREVIEW_SIZE = 5  # Entries fetched when a playlist URL is analyzed
+PLAYLIST_PAGE_SIZE = 50  # Entries fetched per page when iterating a playlist
+PLAYLIST_DOWNLOAD_LIMIT = 3  # Entries downloaded per playlist request
+PLAYLIST_PARALLEL_DOWNLOADS = 2  # Entries downloaded at the same time
+PLAYLIST_DISK_FILES = 2  # Largest possible files allowed to wait for upload
+PLAYLIST_DISK_BUDGET = PLAYLIST_DISK_FILES * MAX_FILE_SIZE  # Downloaded bytes allowed to wait; set again once the endpoint is known
+
+# Download queue configuration
+QUEUE_PATH = "download_queue.sqlite3"
+QUEUE_WORKERS = MAX_WORKERS  # Jobs taken from the queue at the same time
+QUEUE_POLL_INTERVAL = 5  # Seconds between queue checks when idle
+
+# Callback URL store configuration
+URL_CACHE_SIZE = 10000  # Max URLs kept in memory
+URL_CACHE_MAX_BYTES = 4 * 1024 * 1024  # Max total URL bytes kept in memory
+URL_CACHE_TTL = 7 * 24 * 3600  # Keyboard buttons expire after a week
+URL_CACHE_PATH = "url_cache.sqlite3"  # Set to None to keep URLs in memory only
+
+# Update handling and HTTP connection pools
+MAX_CONCURRENT_UPDATES = 32  # Handlers running at once; updates within a chat still run in order
+MAX_PENDING_UPDATES = 256  # Updates admitted at once, including those waiting behind their chat
+UNORDERED_COMMANDS = ('/cancel',)  # Commands that do not wait behind their chat's earlier updates
+API_POOL_SIZE = 64  # Connections for API calls and uploads (handlers, queue workers, progress edits)
+API_POOL_TIMEOUT = 10  # Seconds to wait for a free API connection
+GET_UPDATES_POOL_SIZE = 1  # Polling holds a single long-poll request open
+GET_UPDATES_READ_TIMEOUT = 30  # Seconds a long poll may wait for updates
+UPLOAD_WRITE_TIMEOUT = 300  # Seconds allowed for sending a file's bytes
+
+# Webhook front-ends and shared state
+WEBHOOK_URL = None  # Public HTTPS URL Telegram posts updates to, e.g. "https://bot.example.com/telegram"; None polls
+WEBHOOK_LISTEN = "127.0.0.1"  # Address the embedded server binds to behind the reverse proxy
+WEBHOOK_PORT = 8443  # Port of this front-end; pass another with --port to start more
+WEBHOOK_SECRET_TOKEN = None  # Telegram sends it with every update and the server rejects requests without it
+WEBHOOK_MAX_CONNECTIONS = 40  # Concurrent update deliveries Telegram may open
+SHARED_STORE_URL = None  # e.g. "shared_state.sqlite3" (one host) or "redis://localhost:6379/0", which also holds the download queue; None keeps state per process
+HEARTBEAT_INTERVAL = 10  # Seconds between liveness updates in the shared store
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}"  # Owner name for the jobs this process runs
+
+# Download workers (see download_worker.py)
+EXTERNAL_WORKERS = False  # True leaves queued downloads to worker processes; needs SHARED_STORE_URL
+STATE_SERVER_LISTEN = "127.0.0.1"  # Plain HTTP; reach it from other hosts through a TLS reverse proxy
+STATE_SERVER_PORT = None  # e.g. 8090; None serves no remote workers
+STATE_SERVER_TOKEN = None  # Shared secret workers must send; required with STATE_SERVER_PORT
+
+# Prometheus metrics
+METRICS_LISTEN = "127.0.0.1"  # Address Prometheus scrapes /metrics at; use a private address for a remote Prometheus
+METRICS_PORT = None  # e.g. 9464; front-ends on other webhook ports and each download worker use the following ports
+
 # Store URL mappings to avoid long callback data
-url_cache = {}
+url_cache = None
 
 def update_ytdlp():
     """
@@ -96,18 +212,61 @@ def generate_url_hash(url):
     hash_object = hashlib.md5(url.encode())
     return hash_object.hexdigest()[:10]
 
+def extract_video_id(url):
+    """Extract the canonical YouTube video id from a URL, or None if there is none."""
+    try:
+        parsed = urllib.parse.urlparse(url)
+    except ValueError:
+        return None
+    
+    host = parsed.netloc.lower()
+    path_parts = [part for part in parsed.path.split('/') if part]
+    
+    if host.endswith('youtu.be'):
+        return path_parts[0] if path_parts else None
+    
+    if 'youtube' in host:
+        video_ids = urllib.parse.parse_qs(parsed.query).get('v')
+        if video_ids:
+            return video_ids[0]
+        if len(path_parts) >= 2 and path_parts[0] in ('shorts', 'embed', 'live', 'v'):
+            return path_parts[1]
+    
+    return None
+
+def extract_playlist_id(url):
+    """Extract the YouTube playlist id from a URL, or None if there is none."""
+    try:
+        playlist_ids = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get('list')
+    except ValueError:
+        return None
+    return playlist_ids[0] if playlist_ids else None
+
+def metadata_key(url):
+    """Build the canonical info cache key for a URL."""
+    playlist_id = extract_playlist_id(url)
+    if playlist_id:
+        return f"playlist:{playlist_id}"
+    video_id = extract_video_id(url)
+    if video_id:
+        return f"video:{video_id}"
+    return f"url:{url}"
+
 class YouTubeDownloader:
     def __init__(self):
         self.temp_dir = tempfile.mkdtemp()
+        # Optional RAM-backed workspace root, also allowed in release_workspace()
+        self.spool_dir = None
         logger.info(f"Created temp directory: {self.temp_dir}")
     
-    def get_video_info(self, url):
-        """Get video information without downloading."""
+    def _info_opts(self, **extra_opts):
+        """Build yt-dlp options for info extraction."""
         # Enhanced yt-dlp options to bypass restrictions
         ydl_opts = {
             'quiet': True,
             'no_warnings': True,
-            'extract_flat': False,
+            # Playlists only list their entries; videos are resolved when downloaded
+            'extract_flat': 'in_playlist',
             'skip_download': True,
             'no_check_certificates': True,
             'extractor_args': {
@@ -121,6 +280,46 @@ class YouTubeDownloader:
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
             }
         }
+        ydl_opts.update(extra_opts)
+        return ydl_opts
+    
+    @staticmethod
+    def _flat_entry(entry):
+        """Reduce a flat playlist entry to the fields the bot needs."""
+        video_id = entry.get('id')
+        return {
+            'id': video_id,
+            'title': entry.get('title') or 'Unknown',
+            'url': entry.get('url') or f"https://youtube.com/watch?v={video_id}",
+            'duration': entry.get('duration'),
+        }
+    
+    @staticmethod
+    def _error_message(error_msg):
+        """Return the user message for a known yt-dlp error, or None."""
+        if "HTTP Error 429" in error_msg or "not a bot" in error_msg:
+            return THROTTLED_MESSAGE
+        elif "HTTP Error 403" in error_msg:
+            return "❌ Video is restricted or unavailable. Try another video."
+        elif "Private video" in error_msg:
+            return "❌ This video is private."
+        elif "Video unavailable" in error_msg:
+            return "❌ Video is unavailable."
+        elif "Sign in to confirm your age" in error_msg:
+            return "❌ Video requires age verification."
+        return None
+    
+    def get_video_info(self, url):
+        """
+        Get video information without downloading.
+        
+        Returns (info, error) where error is the message for the user when
+        info is None. Playlists are extracted flat and only the first
+        PLAYLIST_PREVIEW_SIZE entries are fetched, so analysis costs the
+        same for any playlist length. Use playlist_entries() to page
+        through the rest.
+        """
+        ydl_opts = self._info_opts(playlist_items=f'1-{PLAYLIST_PREVIEW_SIZE}')
         
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
@@ -129,23 +328,20 @@ class YouTubeDownloader:
                 
                 if not info:
                     logger.error("No info extracted from URL")
-                    return None
+                    return None, "❌ No video information found."
                 
                 # Handle playlist
                 if info.get('_type') == 'playlist':
-                    entries = info.get('entries', [])
-                    # Filter out None entries and limit for display
-                    valid_entries = [entry for entry in entries if entry is not None]
-                    limited_entries = valid_entries[:5] if len(valid_entries) > 5 else valid_entries
+                    entries = [self._flat_entry(entry) for entry in info.get('entries') or [] if entry]
                     
                     return {
                         'title': info.get('title', 'Unknown Playlist'),
                         'uploader': info.get('uploader', 'Unknown'),
-                        'playlist_count': len(valid_entries),
+                        'playlist_count': info.get('playlist_count') or len(entries),
                         'is_playlist': True,
-                        'entries': limited_entries,
-                        'full_entries': valid_entries
-                    }
+                        'id': info.get('id', ''),
+                        'entries': entries
+                    }, None
                 else:
                     return {
                         'title': info.get('title', 'Unknown'),
@@ -156,19 +352,72 @@ class YouTubeDownloader:
                         'is_playlist': False,
                         'id': info.get('id', ''),
                         'formats': info.get('formats', [])
-                    }
+                    }, None
                     
         except yt_dlp.DownloadError as e:
-            logger.error(f"yt-dlp download error: {e}")
-            return None
+            error_msg = str(e)
+            logger.error(f"yt-dlp download error: {error_msg}")
+            return None, self._error_message(error_msg) or f"❌ Could not get video info: {error_msg[:100]}..."
         except Exception as e:
             logger.error(f"Error getting video info: {e}")
-            return None
+            return None, f"❌ Unexpected error: {str(e)[:100]}..."
+    
+    def iter_playlist_entries(self, url, start=1, page_size=PLAYLIST_PAGE_SIZE):
+        """
+        Yield flat playlist entries one page at a time, starting at index start.
+        
+        Each page is a separate flat extraction, so only the pages that are
+        actually consumed are fetched.
+        """
+        while True:
+            end = start + page_size - 1
+            ydl_opts = self._info_opts(playlist_items=f'{start}-{end}')
+            
+            try:
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    logger.info(f"Fetching playlist entries {start}-{end}: {url}")
+                    info = ydl.extract_info(url, download=False)
+            except Exception as e:
+                logger.error(f"Error fetching playlist entries: {e}")
+                return
+            
+            page = list((info or {}).get('entries') or [])
+            for entry in page:
+                if entry:
+                    yield self._flat_entry(entry)
+            
+            if len(page) < page_size:
+                return
+            start = end + 1
     
-    def download_video(self, url, quality='best', audio_only=False):
-        """Download video or audio with enhanced options."""
+    def playlist_entries(self, url, start, count):
+        """Return up to count flat entries from index start on, fetching only the pages needed."""
+        pages = self.iter_playlist_entries(url, start, page_size=min(count, PLAYLIST_PAGE_SIZE))
+        return list(itertools.islice(pages, count))
+    
+    def download_video(self, url, quality='best', audio_only=False, format_selector=None,
+                       cancel_event=None, progress_hook=None, defer_postprocess=False, workspace=None):
+        """
+        Download video or audio with enhanced options.
+        
+        format_selector overrides the quality-based selector, e.g. with a
+        format chosen by the format planner. progress_hook, if given, is
+        called from the download thread with dicts describing download
+        progress ('phase': 'download') and postprocessing steps ('phase':
+        'postprocess'). Each job gets its own workspace under temp_dir. On success the file
+        is left in place and the caller must hand the returned path to
+        release_workspace() once it is done with it.
+        
+        With defer_postprocess=True, FFmpeg merges and conversions are not
+        run; a PostprocessJob is returned in place of the path and must be
+        finished with run_postprocess() and check_file().
+        
+        workspace, if given, is an empty job directory to use instead of a
+        new one under temp_dir, e.g. one from the memory spool.
+        """
+        job_dir = workspace or tempfile.mkdtemp(prefix='job_', dir=self.temp_dir)
         filename_template = '%(title)s.%(ext)s'
-        output_path = os.path.join(self.temp_dir, filename_template)
+        output_path = os.path.join(job_dir, filename_template)
         
         # Enhanced yt-dlp options to bypass restrictions
         base_opts = {
@@ -190,24 +439,53 @@ class YouTubeDownloader:
             'extract_flat': False,
         }
         
+        progress_hooks = []
+        if cancel_event is not None:
+            def check_cancelled(d):
+                if cancel_event.is_set():
+                    raise yt_dlp.utils.DownloadCancelled()
+            progress_hooks.append(check_cancelled)
+        
+        if progress_hook is not None:
+            def report_download(d):
+                if d.get('status') == 'downloading':
+                    progress_hook({
+                        'phase': 'download',
+                        'downloaded': d.get('downloaded_bytes'),
+                        'total': d.get('total_bytes') or d.get('total_bytes_estimate'),
+                        'speed': d.get('speed'),
+                        'eta': d.get('eta'),
+                    })
+            
+            def report_postprocess(d):
+                if d.get('status') == 'started' and d.get('postprocessor') != 'MoveFiles':
+                    progress_hook({'phase': 'postprocess', 'postprocessor': d.get('postprocessor')})
+            
+            progress_hooks.append(report_download)
+            base_opts['postprocessor_hooks'] = [report_postprocess]
+        
+        if progress_hooks:
+            base_opts['progress_hooks'] = progress_hooks
+        
         if audio_only:
             ydl_opts = {
                 **base_opts,
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
+                'format': format_selector or ('bestaudio/best' if AUDIO_TRANSCODE else 'bestaudio[ext=m4a]/bestaudio/best'),
+                'postprocessors': [
+                    audio_postprocessor('mp3' if AUDIO_TRANSCODE else TELEGRAM_AUDIO_FORMAT, '192')
+                ],
             }
         else:
-            # Format selection based on quality
-            if quality == 'high':
-                format_selector = 'best[height<=720][filesize<?50M]/bestvideo[height<=720]+bestaudio/best[height<=720]'
+            # Format selection based on quality, unless a planned format was given
+            limit = f"{MAX_FILE_SIZE // (1024 * 1024)}M"
+            if format_selector:
+                pass
+            elif quality == 'high':
+                format_selector = f'best[height<=720][filesize<?{limit}]/bestvideo[height<=720]+bestaudio/best[height<=720]'
             elif quality == 'medium':
-                format_selector = 'best[height<=480][filesize<?50M]/bestvideo[height<=480]+bestaudio/best[height<=480]'
+                format_selector = f'best[height<=480][filesize<?{limit}]/bestvideo[height<=480]+bestaudio/best[height<=480]'
             else:  # best
-                format_selector = 'best[filesize<?50M]/bestvideo+bestaudio/best'
+                format_selector = f'best[filesize<?{limit}]/bestvideo+bestaudio/best'
             
             ydl_opts = {
                 **base_opts,
@@ -215,55 +493,79 @@ class YouTubeDownloader:
                 'merge_output_format': 'mp4',
             }
         
+        file_path = None
         try:
             logger.info(f"Starting download: {url}")
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
-                
-                # Find the downloaded file
-                downloaded_files = []
-                for file in os.listdir(self.temp_dir):
-                    if file.endswith(('.mp4', '.mp3', '.webm', '.mkv', '.m4a')):
-                        downloaded_files.append(file)
+            ydl_class = DeferredPostprocessYDL if defer_postprocess else yt_dlp.YoutubeDL
+            with ydl_class(ydl_opts) as ydl:
+                info = ydl.extract_info(url, download=True)
                 
-                if not downloaded_files:
-                    logger.error("No downloaded files found")
-                    return None, "Download completed but file not found."
-                
-                # Get the most recent file (in case of multiple)
-                latest_file = max(downloaded_files, key=lambda f: os.path.getctime(os.path.join(self.temp_dir, f)))
-                file_path = os.path.join(self.temp_dir, latest_file)
-                file_size = os.path.getsize(file_path)
-                
-                logger.info(f"Downloaded file: {latest_file}, size: {file_size} bytes")
-                
-                if file_size > MAX_FILE_SIZE:
-                    os.remove(file_path)
-                    return None, f"File too large ({file_size/1024/1024:.1f}MB > 50MB). Try lower quality."
-                
-                if file_size == 0:
-                    os.remove(file_path)
-                    return None, "Downloaded file is empty."
+                if defer_postprocess and ydl.deferred:
+                    job = ydl.deferred[-1]
+                    if job.has_work():
+                        # FFmpeg steps run in the postprocess stage
+                        file_path = job
+                        return job, None
+                    result_path = run_postprocess(job)
+                else:
+                    # Take the final path yt-dlp reports after postprocessing
+                    files, _ = result_files(info)
+                    if not files:
+                        logger.error("No downloaded files found")
+                        return None, "Download completed but file not found."
+                    result_path = files[-1]['path']
                 
-                return file_path, None
+                checked_path, error = self.check_file(result_path)
+                file_path = checked_path
+                return checked_path, error
                         
+        except yt_dlp.utils.DownloadCancelled:
+            logger.info(f"Download cancelled: {url}")
+            return None, "🛑 Download cancelled."
+                
         except yt_dlp.DownloadError as e:
             error_msg = str(e)
             logger.error(f"yt-dlp download error: {error_msg}")
-            if "HTTP Error 403" in error_msg:
-                return None, "❌ Video is restricted or unavailable. Try another video."
-            elif "Private video" in error_msg:
-                return None, "❌ This video is private."
-            elif "Video unavailable" in error_msg:
-                return None, "❌ Video is unavailable."
-            elif "Sign in to confirm your age" in error_msg:
-                return None, "❌ Video requires age verification."
-            else:
-                return None, f"❌ Download failed: {error_msg[:100]}..."
+            return None, self._error_message(error_msg) or f"❌ Download failed: {error_msg[:100]}..."
                 
         except Exception as e:
             logger.error(f"Download error: {e}")
             return None, f"❌ Unexpected error: {str(e)[:100]}..."
+        
+        finally:
+            if file_path is None:
+                self.release_workspace(job_dir)
+    
+    def check_file(self, path):
+        """Return (path, None) if a finished download can be sent, else (None, error)."""
+        if not path or not os.path.exists(path):
+            logger.error("No downloaded files found")
+            return None, "Download completed but file not found."
+        
+        file_size = os.path.getsize(path)
+        logger.info(f"Downloaded file: {os.path.basename(path)}, size: {file_size} bytes")
+        
+        if file_size > MAX_FILE_SIZE and not FIT_OVERSIZED:
+            return None, f"File too large ({file_size/1024/1024:.1f}MB > {MAX_FILE_SIZE // (1024 * 1024)}MB). Try lower quality."
+        
+        if file_size == 0:
+            return None, "Downloaded file is empty."
+        
+        return path, None
+    
+    def release_workspace(self, path):
+        """Remove the job workspace that holds path (a job directory or a file in it)."""
+        job_dir = path if os.path.isdir(path) else os.path.dirname(path)
+        # Never remove anything outside our own temp directories
+        roots = [os.path.abspath(root) for root in (self.temp_dir, self.spool_dir) if root]
+        if os.path.dirname(os.path.abspath(job_dir)) not in roots:
+            logger.warning(f"Refusing to remove workspace outside temp dir: {job_dir}")
+            return
+        try:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            logger.info(f"Released workspace: {job_dir}")
+        except Exception as e:
+            logger.error(f"Workspace cleanup error: {e}")
     
     def cleanup(self):
         """Clean up temporary files."""
@@ -279,9 +581,103 @@ class YouTubeDownloader:
 # Global downloader instance
 downloader = None
 
+# Global worker pool for blocking yt-dlp calls
+executor = None
+
+# Global process pool for FFmpeg postprocessing, or None to postprocess in the download workers
+postprocess_stage = None
+
+# Global RAM-backed workspace budget for small audio downloads
+memory_spool = None
+
+# Global Telegram file_id cache
+file_id_cache = None
+
+# Global video/playlist info cache
+metadata_cache = None
+
+# Per-chat ordered update processor used by the application
+update_processor = None
+
+# Global store shared by all front-ends, or None when running a single process
+shared_store = None
+# Last cancel request acted on for each user, so each request cancels once
+seen_cancel_requests = {}
+heartbeat_task = None
+
+# Serves the queue and store to download workers on other hosts
+state_server = None
+
+# Prometheus metrics, served by metrics_server when METRICS_PORT is set
+metrics_server = None
+EXTRACT_SECONDS = Histogram(
+    'ytbot_extract_seconds', 'Time to extract video or playlist info', ['result'],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60)
+)
+DOWNLOAD_SECONDS = Histogram(
+    'ytbot_download_seconds', 'Time to download a file, excluding the wait for a worker', ['kind'],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600)
+)
+DOWNLOAD_SPEED = Histogram(
+    'ytbot_download_speed_bytes_per_second', 'Average download speed of each file', ['kind'],
+    # YouTube throttling shows up in the lowest buckets
+    buckets=(32 * 1024, 128 * 1024, 512 * 1024, 2 * 1024 * 1024, 8 * 1024 * 1024, 32 * 1024 * 1024)
+)
+DOWNLOAD_BYTES = Counter('ytbot_download_bytes_total', 'Bytes of downloaded files', ['kind'])
+UPLOAD_SECONDS = Histogram(
+    'ytbot_upload_seconds', 'Time to upload a file to Telegram', ['kind'],
+    buckets=(1, 2, 5, 10, 30, 60, 120, 300)
+)
+ERRORS = Counter('ytbot_errors_total', 'Failed extractions, downloads and uploads by cause', ['stage', 'category'])
+# Queue, worker, cache and workspace state is read at scrape time by StateCollector
+
+def release_download(result):
+    """Remove the workspace of a shared download once nobody needs it."""
+    file_path, _ = result
+    if file_path:
+        downloader.release_workspace(file_path)
+        if memory_spool:
+            memory_spool.release(file_path)
+
+# Coalesces identical downloads that are in flight at the same time
+download_flights = SingleFlight(cleanup=release_download)
+
+# Progress listeners for each in-flight download, keyed like download_flights
+progress_listeners = {}
+
+# Rate-limited status message updates
+progress_reporter = ProgressReporter(interval=PROGRESS_INTERVAL)
+
+# Global durable download queue and its worker tasks
+download_queue = None
+queue_wakeup = None
+queue_workers = []
+
+class JobTarget:
+    """Chat and status message a download job reports to, usable after a restart."""
+    
+    def __init__(self, bot, user_id, chat_id, message_id):
+        self.bot = bot
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+    
+    async def edit_message_text(self, text, **kwargs):
+        """Edit the job's status message."""
+        return await self.bot.edit_message_text(
+            text, chat_id=self.chat_id, message_id=self.message_id, **kwargs
+        )
+
+BUSY_MESSAGE = "⏳ You already have downloads in progress. Please wait for them to finish or use /cancel."
+THROTTLED_MESSAGE = "⏳ YouTube is rate-limiting downloads right now. Please try again later."
+
+def audio_format_label():
+    """Describe the audio format users receive."""
+    return "MP3" if AUDIO_TRANSCODE else "M4A, or MP3 for other codecs"
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command handler."""
-    welcome_message = """
+    welcome_message = f"""
 🎥 **Welcome to YouTube Downloader Bot!**
 
 📝 **How to use:**
@@ -292,11 +688,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🎯 **Supported:**
 • Single videos
 • Playlists (first 3 videos)
-• Audio extraction (MP3)
+• Audio extraction ({audio_format_label()})
 • Multiple quality options
 
 ⚠️ **Limitations:**
-• Max file size: 50MB
+• Max file size: {MAX_FILE_SIZE // (1024 * 1024)}MB
 • Some videos may be restricted
 • Processing time: 1-3 minutes
 
@@ -306,17 +702,20 @@ Just send me a YouTube URL to get started! 🚀
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Help command handler."""
-    help_text = """
+    help_text = f"""
 🔧 **Bot Commands:**
 
 /start - Welcome message
 /help - Show this help
+/queue - Show your queued downloads
+/cancel - Cancel your queued and running downloads
+/stats - Show cache statistics
 
 🎬 **Download Options:**
 • **Best Quality** - Highest available quality
 • **High Quality** - 720p maximum
 • **Medium Quality** - 480p maximum  
-• **Audio Only** - MP3 format
+• **Audio Only** - {audio_format_label()}
 
 📋 **Playlist Support:**
 • Downloads first 3 videos automatically
@@ -324,7 +723,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • Audio-only option available
 
 ⚠️ **Important Notes:**
-• Maximum file size: 50MB per file
+• Maximum file size: {MAX_FILE_SIZE // (1024 * 1024)}MB per file
 • Some videos may be geo-restricted
 • Private videos cannot be downloaded
 • Processing may take a few minutes
@@ -337,7 +736,328 @@ If a video fails to download, try:
 """
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
-def create_quality_keyboard(url_hash, is_playlist=False, playlist_count=0):
+async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Cancel command handler."""
+    user_id = update.effective_user.id
+    cancelled = await asyncio.to_thread(download_queue.cancel_user, user_id) if download_queue else 0
+    cancelled += executor.cancel_user(user_id) if executor else 0
+    if shared_store:
+        # Jobs of this user running in other front-ends are cancelled by their heartbeat
+        request = str(time.time())
+        shared_store.set(f"cancel:{user_id}", request, ttl=HEARTBEAT_INTERVAL * 3)
+        seen_cancel_requests[user_id] = request
+    if cancelled:
+        await update.message.reply_text(f"🛑 Cancelling {cancelled} running job(s)...")
+    elif shared_store:
+        await update.message.reply_text("🛑 Cancelling your downloads on all bot instances...")
+    else:
+        await update.message.reply_text("ℹ️ You have no downloads in progress.")
+
+def format_wait(seconds):
+    """Format an estimated wait for display."""
+    if seconds < 60:
+        return "under a minute"
+    return f"~{round(seconds / 60)} min"
+
+async def queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Queue command handler."""
+    if not download_queue:
+        await update.message.reply_text("ℹ️ You have no queued downloads.")
+        return
+    
+    # Reading the queue can take a while with many jobs or a remote server; keep other chats responsive
+    jobs = await asyncio.to_thread(download_queue.user_jobs, update.effective_user.id, QUEUE_WORKERS)
+    if not jobs:
+        await update.message.reply_text("ℹ️ You have no queued downloads.")
+        return
+    
+    depth = await asyncio.to_thread(download_queue.depth)
+    lines = [f"📥 **Your downloads** ({depth['pending']} queued, {depth['running']} running overall)", ""]
+    for job in jobs:
+        kind = "📋 Playlist" if job['kind'] == 'playlist' else ("🎵 Audio" if job['is_audio'] else "📹 Video")
+        if job['position'] is None:
+            lines.append(f"{kind}: ⬇️ in progress")
+        else:
+            lines.append(f"{kind}: #{job['position']} in queue, starts in {format_wait(job['eta'])}")
+    await update.message.reply_text("\n".join(lines), parse_mode='Markdown')
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stats command handler."""
+    lines = ["📊 **Bot Statistics**", ""]
+    
+    if file_id_cache:
+        stats = file_id_cache.stats()
+        lines.append(
+            f"📦 **File cache:** {stats['entries']} files, "
+            f"{stats['hits']} hits / {stats['misses']} misses ({stats['hit_ratio']:.0%})"
+        )
+    
+    if metadata_cache:
+        stats = metadata_cache.stats()
+        lines.append(
+            f"🗂 **Info cache:** {stats['entries']}/{stats['max_entries']} entries, "
+            f"{stats['hits']} hits / {stats['misses']} misses ({stats['hit_ratio']:.0%}), "
+            f"{stats['evictions']} evicted"
+        )
+    
+    if update_processor:
+        stats = update_processor.stats()
+        lines.append(
+            f"📨 **Updates:** {stats['processed']} handled, {stats['active_chats']} chats active, "
+            f"{stats['waiting']} waiting behind their chat"
+        )
+    
+    if download_queue:
+        depth = await asyncio.to_thread(download_queue.depth)
+        lines.append(f"📥 **Queue:** {depth['pending']} waiting, {depth['running']} running")
+    
+    if executor:
+        lines.append(f"⬇️ **Download stage:** {executor.active_jobs()}/{executor.max_workers} active")
+    
+    if memory_spool:
+        stats = memory_spool.stats()
+        lines.append(
+            f"🧠 **Memory spool:** {stats['used']/1024/1024:.0f}/{stats['budget']/1024/1024:.0f}MB in use, "
+            f"{stats['spooled']} spooled, {stats['fallbacks']} sent to disk"
+        )
+    
+    if postprocess_stage:
+        stats = postprocess_stage.stats()
+        lines.append(
+            f"🛠 **Postprocess stage:** {stats['running']}/{stats['workers']} running, "
+            f"{stats['queued']} waiting, {stats['completed']} done, {stats['failed']} failed, "
+            f"avg {stats['avg_seconds']:.1f}s"
+        )
+    
+    lines.append(
+        f"🔗 **Downloads:** {download_flights.started} started, "
+        f"{download_flights.coalesced} coalesced, {download_flights.in_flight()} in flight"
+    )
+    
+    await update.message.reply_text("\n".join(lines), parse_mode='Markdown')
+
+def media_kind(is_audio):
+    """Return the kind label used by the metrics."""
+    return 'audio' if is_audio else 'video'
+
+def timed(fn, *args, **kwargs):
+    """Call fn in a worker and return (seconds it took, result), leaving out the wait for the worker."""
+    started = time.monotonic()
+    result = fn(*args, **kwargs)
+    return time.monotonic() - started, result
+
+def error_category(error):
+    """Map a download error message to its category in ytbot_errors_total, or 'cancelled'."""
+    if error == THROTTLED_MESSAGE:
+        return 'throttled'
+    lowered = error.lower()
+    for category, words in (
+        ('cancelled', ('cancelled',)),
+        ('restricted', ('restricted', 'private', 'age verification')),
+        ('unavailable', ('unavailable',)),
+        ('too_large', ('too large',)),
+    ):
+        if any(word in lowered for word in words):
+            return category
+    return 'failed'
+
+def count_error(stage, error):
+    """Count a failed stage in ytbot_errors_total. Cancellations by the user are not errors."""
+    category = error_category(error)
+    if category != 'cancelled':
+        ERRORS.labels(stage=stage, category=category).inc()
+
+@contextmanager
+def observe_upload(is_audio):
+    """Time an upload to Telegram, counting it as an error if it raises."""
+    started = time.monotonic()
+    try:
+        yield
+    except Exception as e:
+        if isinstance(e, RetryAfter):
+            category = 'throttled'
+        elif isinstance(e, TimedOut):
+            category = 'timeout'
+        else:
+            category = 'failed'
+        ERRORS.labels(stage='upload', category=category).inc()
+        raise
+    UPLOAD_SECONDS.labels(media_kind(is_audio)).observe(time.monotonic() - started)
+
+async def fetch_video_info(user_id, url):
+    """Get video or playlist info through the metadata cache, as (info, error) like get_video_info()."""
+    key = metadata_key(url)
+    if metadata_cache:
+        info = metadata_cache.get(key)
+        if info is not None:
+            return info, None
+    
+    try:
+        seconds, (info, error) = await executor.run(
+            user_id, timed, downloader.get_video_info, url, timeout=EXTRACT_TIMEOUT
+        )
+    except JobTimeoutError:
+        ERRORS.labels(stage='extract', category='timeout').inc()
+        raise
+    EXTRACT_SECONDS.labels('ok' if info else 'failed').observe(seconds)
+    if not info:
+        count_error('extract', error)
+    if info and metadata_cache:
+        metadata_cache.put(key, info)
+    return info, error
+
+def plan_download(info, quality, is_audio):
+    """
+    Plan the format for a single download from already extracted info.
+    
+    Returns (plan, error). plan is None without an error when the formats
+    carry no size information, or nothing fits and FIT_OVERSIZED is set
+    and the download can be split or transcoded to fit afterwards, in
+    which case the quality selector is used.
+    """
+    formats = info.get('formats') or []
+    duration = info.get('duration') or 0
+    
+    if not has_size_info(formats, duration):
+        return None, None
+    
+    if is_audio:
+        plan = plan_audio(formats, duration, MAX_FILE_SIZE, () if AUDIO_TRANSCODE else TELEGRAM_AUDIO_EXTS)
+    else:
+        plan = plan_format(formats, duration, MAX_FILE_SIZE, QUALITY_HEIGHTS.get(quality))
+    
+    if not plan and FIT_OVERSIZED:
+        # Nothing fits as is; size what the quality selector would download
+        if is_audio:
+            oversized = plan_audio(formats, duration, math.inf, () if AUDIO_TRANSCODE else TELEGRAM_AUDIO_EXTS)
+        else:
+            oversized = plan_format(formats, duration, math.inf, QUALITY_HEIGHTS.get(quality))
+        media = {'size': oversized['size'], 'duration': duration, 'has_video': not is_audio} if oversized else None
+        if not media or choose_strategy(media, MAX_FILE_SIZE):
+            # Download with the quality selector and fit afterwards
+            return None, None
+    if not plan:
+        return None, f"❌ This video is too large to send at this quality (limit {MAX_FILE_SIZE // (1024 * 1024)}MB). Try a lower quality or audio only."
+    return plan, None
+
+def quality_label(label, info, quality, is_audio):
+    """Add the planned file size to a quality button label."""
+    if not info:
+        return label
+    plan, error = plan_download(info, quality, is_audio)
+    if error:
+        return f"{label} (too large)"
+    if plan:
+        return f"{label} (~{plan['size']/1024/1024:.1f}MB)"
+    return label
+
+async def coalesced_download(user_id, url, quality, is_audio, video_id=None, format_selector=None,
+                             on_progress=None, planned_size=None):
+    """
+    Download through the worker pool, sharing identical in-flight downloads.
+    
+    on_progress receives download_video progress dicts from the worker
+    thread; every requester attached to the download gets them. Returns
+    (file_path, error, release). Everyone who receives a file must call
+    release() when done with it; the workspace is removed after the last
+    release. Downloads with a planned_size under SPOOL_THRESHOLD are kept in
+    the memory spool while it has room.
+    """
+    key = (video_id or url, quality, is_audio, format_selector)
+    # The shared download belongs to no single user; each requester attaches to it
+    async with executor.attach(user_id):
+        listeners = progress_listeners.setdefault(key, [])
+        if on_progress:
+            listeners.append(on_progress)
+        
+        def broadcast(progress):
+            for listener in list(listeners):
+                listener(progress)
+        
+        # Hooks cannot be sent to worker processes
+        progress_hook = broadcast if executor.mode == 'thread' else None
+        
+        async def run_download():
+            workspace = memory_spool.reserve(planned_size) if memory_spool and planned_size else None
+            file_path = None
+            job = None
+            postprocessing = False
+            
+            def release_abandoned():
+                # Runs once the postprocess pool stops writing into a cancelled download's workspace
+                downloader.release_workspace(job.filename)
+                if workspace:
+                    memory_spool.release(workspace)
+            
+            try:
+                try:
+                    seconds, (file_path, error) = await executor.run(
+                        None, timed, downloader.download_video, url, quality, is_audio,
+                        format_selector=format_selector, progress_hook=progress_hook,
+                        defer_postprocess=postprocess_stage is not None, workspace=workspace,
+                        timeout=DOWNLOAD_TIMEOUT, cancellable=True
+                    )
+                except JobTimeoutError:
+                    ERRORS.labels(stage='download', category='timeout').inc()
+                    raise
+                if error:
+                    count_error('download', error)
+                if isinstance(file_path, PostprocessJob):
+                    # The download slot is free again; FFmpeg work waits for a CPU
+                    job, file_path = file_path, None
+                    postprocessing = True
+                    file_path, error = await finish_postprocess(job, broadcast, on_abandoned=release_abandoned)
+                    postprocessing = False
+                    if error:
+                        count_error('postprocess', error)
+                if file_path:
+                    # Merged or converted files stand in for the streams that were downloaded
+                    size = os.path.getsize(file_path)
+                    kind = media_kind(is_audio)
+                    DOWNLOAD_SECONDS.labels(kind).observe(seconds)
+                    DOWNLOAD_BYTES.labels(kind).inc(size)
+                    DOWNLOAD_SPEED.labels(kind).observe(size / max(seconds, 0.001))
+                return file_path, error
+            finally:
+                if workspace and not file_path and not postprocessing:
+                    # Failed downloads remove their own workspace
+                    memory_spool.release(workspace)
+                if progress_listeners.get(key) is listeners:
+                    del progress_listeners[key]
+        
+        try:
+            result, release = await download_flights.acquire(key, run_download)
+        except asyncio.CancelledError:
+            # Only this requester stops; the others keep the shared download
+            raise JobCancelledError("Download cancelled")
+        finally:
+            if on_progress and on_progress in listeners:
+                listeners.remove(on_progress)
+        file_path, error = result
+    return file_path, error, release
+
+async def finish_postprocess(job, on_progress=None, on_abandoned=None):
+    """
+    Run a deferred download's FFmpeg steps in the postprocess stage. Returns (file_path, error).
+    
+    If this is cancelled, on_abandoned is called once the stage has
+    stopped writing the job's files (see PostprocessStage.call).
+    """
+    if on_progress:
+        on_progress({'phase': 'postprocess', 'postprocessor': job.describe()})
+    try:
+        path = await postprocess_stage.run(job, on_abandoned=on_abandoned)
+    except Exception as e:
+        logger.error(f"Postprocessing error: {e}")
+        downloader.release_workspace(job.filename)
+        return None, f"❌ Processing failed: {str(e)[:100]}..."
+    
+    file_path, error = downloader.check_file(path)
+    if error:
+        downloader.release_workspace(path)
+    return file_path, error
+
+def create_quality_keyboard(url_hash, is_playlist=False, playlist_count=0, info=None):
     """Create inline keyboard for quality selection using URL hash."""
     keyboard = []
     
@@ -351,10 +1071,18 @@ def create_quality_keyboard(url_hash, is_playlist=False, playlist_count=0):
             callback_data=f"pl_aud_{url_hash}"
         )])
     else:
-        keyboard.append([InlineKeyboardButton("📹 Best Quality", callback_data=f"vid_best_{url_hash}")])
-        keyboard.append([InlineKeyboardButton("📹 High (720p)", callback_data=f"vid_high_{url_hash}")])
-        keyboard.append([InlineKeyboardButton("📹 Medium (480p)", callback_data=f"vid_med_{url_hash}")])
-        keyboard.append([InlineKeyboardButton("🎵 Audio Only", callback_data=f"aud_{url_hash}")])
+        keyboard.append([InlineKeyboardButton(
+            quality_label("📹 Best Quality", info, 'best', False), callback_data=f"vid_best_{url_hash}"
+        )])
+        keyboard.append([InlineKeyboardButton(
+            quality_label("📹 High (720p)", info, 'high', False), callback_data=f"vid_high_{url_hash}"
+        )])
+        keyboard.append([InlineKeyboardButton(
+            quality_label("📹 Medium (480p)", info, 'medium', False), callback_data=f"vid_med_{url_hash}"
+        )])
+        keyboard.append([InlineKeyboardButton(
+            quality_label("🎵 Audio Only", info, 'best', True), callback_data=f"aud_{url_hash}"
+        )])
     
     return InlineKeyboardMarkup(keyboard)
 
@@ -375,14 +1103,17 @@ async def handle_url(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Generate hash for URL and store it
     url_hash = generate_url_hash(url)
-    url_cache[url_hash] = url
+    url_cache.put(url_hash, url)
     
     # Show processing message
     processing_msg = await update.message.reply_text("🔍 Analyzing URL... Please wait.")
     
     try:
         # Get video info
-        info = downloader.get_video_info(url)
+        info, error = await fetch_video_info(update.effective_user.id, url)
+        if error == THROTTLED_MESSAGE:
+            await processing_msg.edit_text(error)
+            return
         if not info:
             await processing_msg.edit_text("❌ Could not retrieve video information. The video might be:\n• Private or restricted\n• Unavailable in your region\n• Deleted\n• Age-restricted\n\nPlease try another video.")
             return
@@ -422,10 +1153,17 @@ Choose download quality:
         keyboard = create_quality_keyboard(
             url_hash, 
             info['is_playlist'], 
-            info.get('playlist_count', 0)
+            info.get('playlist_count', 0),
+            info
         )
         await processing_msg.edit_text(info_text, reply_markup=keyboard, parse_mode='Markdown')
         
+    except UserLimitError:
+        await processing_msg.edit_text(BUSY_MESSAGE)
+    except JobTimeoutError:
+        await processing_msg.edit_text("⏰ Analyzing the URL took too long. Please try again later.")
+    except JobCancelledError:
+        await processing_msg.edit_text("🛑 Cancelled.")
     except Exception as e:
         logger.error(f"URL handling error: {e}")
         await processing_msg.edit_text("❌ An error occurred while processing the URL. Please try again or use a different video.")
@@ -450,176 +1188,661 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Determine action
+        quality = 'best'  # default
         if query.data.startswith('pl_'):
             # Playlist download
+            kind = 'playlist'
             is_audio = 'aud' in query.data
-            await download_playlist(query, url, is_audio, context)
         else:
             # Single video download
+            kind = 'single'
             is_audio = query.data.startswith('aud_')
-            quality = 'best'  # default
             
             if 'high' in query.data:
                 quality = 'high'
             elif 'med' in query.data:
                 quality = 'medium'
-            
-            await download_single(query, url, quality, is_audio)
+        
+        # Files Telegram already has are re-sent at once instead of waiting in the queue
+        video_id = extract_video_id(url) if kind == 'single' else None
+        if video_id and await send_cached_file(
+            context.bot, query.message.chat_id, (video_id, quality, is_audio), is_audio
+        ):
+            await query.edit_message_text("✅ Download completed successfully!")
+            return
+        
+        job_id = await asyncio.to_thread(
+            download_queue.enqueue,
+            query.from_user.id, query.message.chat_id, query.message.message_id,
+            kind, url, quality, is_audio
+        )
+        queue_wakeup.set()
+        
+        jobs = await asyncio.to_thread(download_queue.user_jobs, query.from_user.id, QUEUE_WORKERS)
+        position = next((job['position'] for job in jobs if job['id'] == job_id), None)
+        if position:
+            await query.edit_message_text(f"📥 Queued at position {position}. Use /queue to check progress.")
             
     except Exception as e:
         logger.error(f"Button callback error: {e}")
         await query.edit_message_text("❌ An error occurred. Please try again.")
 
-async def download_single(query, url, quality, is_audio):
+async def download_single(target, url, quality, is_audio):
     """Download a single video/audio."""
     global downloader
     
-    await query.edit_message_text("⬇️ Starting download... This may take 1-3 minutes.")
+    video_id = extract_video_id(url)
+    cache_key = (video_id, quality, is_audio) if video_id else None
+    
+    if cache_key and await send_cached_file(target.bot, target.chat_id, cache_key, is_audio):
+        await target.edit_message_text("✅ Download completed successfully!")
+        return
     
     try:
-        file_path, error = downloader.download_video(url, quality, is_audio)
-        
+        # Refuse choices that cannot fit before fetching any bytes
+        info, _ = await fetch_video_info(target.user_id, url)
+        plan, error = plan_download(info, quality, is_audio) if info else (None, None)
         if error:
-            await query.edit_message_text(error)
+            await target.edit_message_text(error)
             return
         
-        if not file_path or not os.path.exists(file_path):
-            await query.edit_message_text("❌ Download failed or file not found.")
-            return
+        await target.edit_message_text("⬇️ Starting download... This may take 1-3 minutes.")
         
-        # Send the file
-        await send_file(query, file_path, is_audio)
+        try:
+            file_path, error, release = await coalesced_download(
+                target.user_id, url, quality, is_audio, video_id,
+                format_selector=plan['format_id'] if plan else None,
+                on_progress=progress_reporter.threadsafe_callback(target),
+                planned_size=plan['size'] if plan and is_audio else None
+            )
+        finally:
+            await progress_reporter.finish(target)
         
+        try:
+            if error:
+                await target.edit_message_text(error)
+                return
+            
+            if not file_path or not os.path.exists(file_path):
+                await target.edit_message_text("❌ Download failed or file not found.")
+                return
+            
+            # Send the file, fitting it under the upload limit if needed
+            if os.path.getsize(file_path) > MAX_FILE_SIZE:
+                await send_fitted(target, file_path, is_audio, cache_key)
+            else:
+                await send_file(target, file_path, is_audio, cache_key, release)
+        finally:
+            release()
+        
+    except UserLimitError:
+        await target.edit_message_text(BUSY_MESSAGE)
+    except JobTimeoutError:
+        await target.edit_message_text("⏰ Download timed out. Try a lower quality or a shorter video.")
+    except JobCancelledError:
+        await target.edit_message_text("🛑 Download cancelled.")
     except Exception as e:
         logger.error(f"Single download error: {e}")
-        await query.edit_message_text(f"❌ Download failed: {str(e)[:100]}...")
+        await target.edit_message_text(f"❌ Download failed: {str(e)[:100]}...")
 
-async def download_playlist(query, url, is_audio, context):
-    """Download playlist (first 3 videos)."""
+async def download_playlist(target, url, is_audio):
+    """
+    Download playlist (first 3 videos).
+    
+    Entries are downloaded in parallel while finished ones are uploaded, so
+    network downloads and Telegram uploads overlap. Uploads still happen in
+    playlist order, and the bytes of downloaded files waiting on disk are
+    capped by PLAYLIST_DISK_BUDGET.
+    """
     global downloader
     
-    await query.edit_message_text("📋 Processing playlist... Downloading first 3 videos.")
+    await target.edit_message_text(f"📋 Processing playlist... Downloading first {PLAYLIST_DOWNLOAD_LIMIT} videos.")
+    
+    user_id = target.user_id
+    chat_id = target.chat_id
+    tasks = []
     
     try:
         # Get playlist info
-        info = downloader.get_video_info(url)
+        info, _ = await fetch_video_info(user_id, url)
         if not info or not info['is_playlist']:
-            await query.edit_message_text("❌ Could not process playlist.")
+            await target.edit_message_text("❌ Could not process playlist.")
             return
         
-        entries = info.get('entries', [])[:3]  # Limit to first 3
-        successful_downloads = 0
+        entries = [entry for entry in info.get('entries', [])[:PLAYLIST_DOWNLOAD_LIMIT] if entry]
+        if len(entries) < PLAYLIST_DOWNLOAD_LIMIT and info['playlist_count'] > PLAYLIST_PREVIEW_SIZE:
+            # The preview ran short; page through the entries after it
+            entries += await executor.run(
+                user_id, downloader.playlist_entries, url, PLAYLIST_PREVIEW_SIZE + 1,
+                PLAYLIST_DOWNLOAD_LIMIT - len(entries), timeout=EXTRACT_TIMEOUT
+            )
+        total = len(entries)
+        progress = {'downloaded': 0, 'sent': 0, 'failed': 0}
         
-        for i, entry in enumerate(entries):
-            if not entry:
-                continue
-                
-            video_url = entry.get('url') or f"https://youtube.com/watch?v={entry.get('id')}"
-            video_title = entry.get('title', f'Video {i+1}')
+        # Parallel downloads count against the user's worker quota
+        parallel = max(1, min(PLAYLIST_PARALLEL_DOWNLOADS, executor.per_user_limit - executor.active_jobs(user_id)))
+        download_slots = asyncio.Semaphore(parallel)
+        # Bytes of downloaded files waiting on disk for their upload
+        disk_budget = ByteBudget(PLAYLIST_DISK_BUDGET)
+        
+        def report_progress():
+            progress_reporter.update(
+                target,
+                f"⬇️ Playlist: {progress['downloaded']}/{total} downloaded, "
+                f"{progress['sent']}/{total} sent"
+                + (f", {progress['failed']} failed" if progress['failed'] else "")
+            )
+        
+        async def download_entry(entry):
+            """Download one entry. Cancellation aborts the whole playlist."""
+            async with download_slots:
+                try:
+                    file_path, error, release = await coalesced_download(
+                        user_id, entry['url'], 'best', is_audio, entry.get('id')
+                    )
+                except JobTimeoutError:
+                    return None, "⏰ Download timed out.", None
+                except UserLimitError:
+                    return None, BUSY_MESSAGE, None
             
-            await query.edit_message_text(f"⬇️ Downloading {i+1}/3: {video_title[:50]}...")
+            if error or not file_path:
+                release()
+                return None, error, None
             
-            file_path, error = downloader.download_video(video_url, 'best', is_audio)
+            file_size = os.path.getsize(file_path)
+            if file_size > MAX_FILE_SIZE:
+                release()
+                return None, f"File too large ({file_size/1024/1024:.1f}MB > {MAX_FILE_SIZE // (1024 * 1024)}MB).", None
             
-            if error:
-                await context.bot.send_message(
-                    chat_id=query.message.chat_id,
-                    text=f"❌ Failed to download '{video_title}': {error}"
+            progress['downloaded'] += 1
+            report_progress()
+            return file_path, None, release
+        
+        async def fetch_entry(entry):
+            """
+            Return an entry's cached file_id, or download it against the disk budget.
+            
+            Returns (file_path, error, release, file_id, charged), where
+            charged is what the file holds of the budget until it is sent.
+            """
+            cache_key = (entry['id'], 'best', is_audio) if entry.get('id') else None
+            if cache_key and file_id_cache:
+                file_id = file_id_cache.get(*cache_key)
+                if file_id:
+                    return None, None, None, file_id, 0
+            
+            # Flat entries carry no sizes; charge the largest file that is kept until it is downloaded
+            await disk_budget.acquire(MAX_FILE_SIZE)
+            try:
+                file_path, error, release = await download_entry(entry)
+            except BaseException:
+                disk_budget.release(MAX_FILE_SIZE)
+                raise
+            
+            if error or not file_path:
+                disk_budget.release(MAX_FILE_SIZE)
+                return file_path, error, release, None, 0
+            # Keep only the file's actual size charged while it waits for upload
+            size = os.path.getsize(file_path)
+            disk_budget.release(MAX_FILE_SIZE - size)
+            return file_path, error, release, None, size
+        
+        report_progress()
+        tasks = [asyncio.create_task(fetch_entry(entry)) for entry in entries]
+        
+        # Deliver results in playlist order while later entries keep downloading
+        for i, (entry, task) in enumerate(zip(entries, tasks)):
+            video_title = entry.get('title') or f'Video {i+1}'
+            cache_key = (entry['id'], 'best', is_audio) if entry.get('id') else None
+            
+            file_path, error, release, file_id, charged = await task
+            
+            if file_id:
+                if await send_cached_file(target.bot, chat_id, cache_key, is_audio, file_id):
+                    progress['downloaded'] += 1
+                    progress['sent'] += 1
+                    report_progress()
+                    continue
+                # Cached file_id was rejected, download it now. Later entries
+                # may hold the whole disk budget, so this one is not charged.
+                file_path, error, release = await download_entry(entry)
+            
+            if error or not file_path:
+                progress['failed'] += 1
+                await target.bot.send_message(
+                    chat_id=chat_id,
+                    text=f"❌ Failed to download '{video_title}': {error or 'file not found'}"
                 )
+                report_progress()
                 continue
             
-            if file_path and os.path.exists(file_path):
-                success = await send_file_to_chat(query.message.chat_id, file_path, is_audio, context)
-                if success:
-                    successful_downloads += 1
+            try:
+                success = await send_file_to_chat(chat_id, file_path, is_audio, target.bot, cache_key, release)
+            finally:
+                disk_budget.release(charged)
+            
+            if success:
+                progress['sent'] += 1
+            else:
+                progress['failed'] += 1
+            report_progress()
         
-        if successful_downloads > 0:
-            await query.edit_message_text(f"✅ Playlist download completed! Successfully downloaded {successful_downloads}/3 videos.")
+        await progress_reporter.finish(target)
+        if progress['sent'] > 0:
+            await target.edit_message_text(f"✅ Playlist download completed! Successfully downloaded {progress['sent']}/{total} videos.")
         else:
-            await query.edit_message_text("❌ All playlist downloads failed.")
+            await target.edit_message_text("❌ All playlist downloads failed.")
         
+    except UserLimitError:
+        await progress_reporter.finish(target)
+        await target.edit_message_text(BUSY_MESSAGE)
+    except JobTimeoutError:
+        await progress_reporter.finish(target)
+        await target.edit_message_text("⏰ Playlist download timed out.")
+    except JobCancelledError:
+        await progress_reporter.finish(target)
+        await target.edit_message_text("🛑 Playlist download cancelled.")
     except Exception as e:
         logger.error(f"Playlist download error: {e}")
-        await query.edit_message_text(f"❌ Playlist download failed: {str(e)[:100]}...")
+        await progress_reporter.finish(target)
+        await target.edit_message_text(f"❌ Playlist download failed: {str(e)[:100]}...")
+    finally:
+        # Stop downloads that are no longer needed and drop their files
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is None:
+                release = task.result()[2]
+                if release:
+                    release()
+
+def remember_file_id(cache_key, message):
+    """Store the file_id of an uploaded file so repeat requests can reuse it."""
+    if not cache_key or not file_id_cache or not message:
+        return
+    media = message.audio or message.video or message.document
+    if media:
+        file_id_cache.put(*cache_key, media.file_id)
 
-async def send_file(query, file_path, is_audio):
-    """Send file through query edit."""
+async def send_cached_file(bot, chat_id, cache_key, is_audio, file_id=None):
+    """Re-send a previously uploaded file by its cached file_id. Returns True if sent."""
+    if not file_id_cache:
+        return False
+    
+    file_id = file_id or file_id_cache.get(*cache_key)
+    if not file_id:
+        return False
+    
+    try:
+        if is_audio:
+            await bot.send_audio(chat_id=chat_id, audio=file_id, caption="🎵 Downloaded audio")
+        else:
+            await bot.send_video(chat_id=chat_id, video=file_id, caption="🎬 Downloaded video")
+        logger.info(f"Served {cache_key[0]} from file_id cache")
+        return True
+    except BadRequest as e:
+        # Telegram no longer knows this file_id, fall back to a fresh download
+        logger.warning(f"Cached file_id rejected for {cache_key[0]}: {e}")
+        file_id_cache.invalidate(*cache_key)
+        return False
+
+@contextmanager
+def upload_input(file_path):
+    """
+    Yield what to pass to send_audio/send_video for a file.
+    
+    With a local Bot API server this is the path, which the server reads
+    itself; otherwise the open file is uploaded.
+    """
+    if LOCAL_BOT_API_URL:
+        yield Path(file_path)
+    else:
+        with open(file_path, 'rb') as file:
+            yield file
+
+async def send_file(target, file_path, is_audio, cache_key=None, release=None):
+    """
+    Send file to the job's chat and report through its status message.
+    
+    release, if given, replaces workspace teardown.
+    """
     file_size = os.path.getsize(file_path)
     file_name = os.path.basename(file_path)
     
-    await query.edit_message_text(f"📤 Uploading {file_name[:30]}... ({file_size/1024/1024:.1f}MB)")
+    await target.edit_message_text(f"📤 Uploading {file_name[:30]}... ({file_size/1024/1024:.1f}MB)")
     
     try:
-        with open(file_path, 'rb') as file:
+        with upload_input(file_path) as file, observe_upload(is_audio):
             if is_audio:
-                await query.message.reply_audio(
+                message = await target.bot.send_audio(
+                    chat_id=target.chat_id,
                     audio=file,
-                    title=file_name.replace('.mp3', ''),
+                    write_timeout=UPLOAD_WRITE_TIMEOUT,
+                    title=os.path.splitext(file_name)[0],
                     caption="🎵 Downloaded audio"
                 )
             else:
-                await query.message.reply_video(
+                message = await target.bot.send_video(
+                    chat_id=target.chat_id,
                     video=file,
+                    write_timeout=UPLOAD_WRITE_TIMEOUT,
                     caption="🎬 Downloaded video"
                 )
         
-        await query.edit_message_text("✅ Download completed successfully!")
+        remember_file_id(cache_key, message)
+        await target.edit_message_text("✅ Download completed successfully!")
         return True
         
     except Exception as e:
         logger.error(f"File send error: {e}")
-        await query.edit_message_text("❌ Failed to send file. It might be too large.")
+        await target.edit_message_text("❌ Failed to send file. It might be too large.")
         return False
     finally:
-        # Clean up file
+        # Tear down the job workspace
+        if release:
+            release()
+        else:
+            downloader.release_workspace(file_path)
+
+async def send_fitted(target, file_path, is_audio, cache_key=None):
+    """
+    Split or re-encode a file over MAX_FILE_SIZE and send the result.
+    
+    Split parts are sent in order. The caller still owns file_path; the
+    fitted copies are removed here.
+    """
+    file_size = os.path.getsize(file_path)
+    await target.edit_message_text(
+        f"✂️ File is {file_size/1024/1024:.1f}MB, fitting it under {MAX_FILE_SIZE // (1024 * 1024)}MB..."
+    )
+    
+    out_dir = tempfile.mkdtemp(prefix='fit_', dir=os.path.dirname(file_path))
+    try:
         try:
-            os.remove(file_path)
+            if postprocess_stage:
+                result = await postprocess_stage.call(fit_to_size, file_path, MAX_FILE_SIZE, out_dir)
+            else:
+                result = await executor.run(
+                    target.user_id, fit_to_size, file_path, MAX_FILE_SIZE, out_dir, timeout=DOWNLOAD_TIMEOUT
+                )
+        except FitError as e:
+            await target.edit_message_text(f"❌ File too large ({file_size/1024/1024:.1f}MB): {e}. Try lower quality.")
+            return False
         except Exception as e:
-            logger.error(f"File cleanup error: {e}")
+            logger.error(f"Fit to size error: {e}")
+            await target.edit_message_text(
+                f"❌ File too large ({file_size/1024/1024:.1f}MB > {MAX_FILE_SIZE // (1024 * 1024)}MB). Try lower quality."
+            )
+            return False
+        
+        parts = result['parts']
+        for i, part in enumerate(parts, start=1):
+            label = f"part {i}/{len(parts)}" if len(parts) > 1 else "re-encoded file"
+            await target.edit_message_text(
+                f"📤 Uploading {label}... ({os.path.getsize(part)/1024/1024:.1f}MB)"
+            )
+            caption = f"Part {i}/{len(parts)}" if len(parts) > 1 else "Re-encoded to fit"
+            with upload_input(part) as file, observe_upload(is_audio):
+                if is_audio:
+                    message = await target.bot.send_audio(
+                        chat_id=target.chat_id,
+                        audio=file,
+                        write_timeout=UPLOAD_WRITE_TIMEOUT,
+                        title=os.path.splitext(os.path.basename(part))[0],
+                        caption=f"🎵 {caption}"
+                    )
+                else:
+                    message = await target.bot.send_video(
+                        chat_id=target.chat_id,
+                        video=file,
+                        write_timeout=UPLOAD_WRITE_TIMEOUT,
+                        caption=f"🎬 {caption}"
+                    )
+        
+        # Only a single re-encoded file can stand in for the download
+        if len(parts) == 1:
+            remember_file_id(cache_key, message)
+        await target.edit_message_text("✅ Download completed successfully!")
+        return True
+    
+    except Exception as e:
+        logger.error(f"File send error: {e}")
+        await target.edit_message_text("❌ Failed to send file.")
+        return False
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
 
-async def send_file_to_chat(chat_id, file_path, is_audio, context):
-    """Send file directly to chat."""
+async def send_file_to_chat(chat_id, file_path, is_audio, bot, cache_key=None, release=None):
+    """Send file directly to chat. release, if given, replaces workspace teardown."""
     try:
-        with open(file_path, 'rb') as file:
+        with upload_input(file_path) as file, observe_upload(is_audio):
             if is_audio:
-                await context.bot.send_audio(
+                message = await bot.send_audio(
                     chat_id=chat_id,
                     audio=file,
+                    write_timeout=UPLOAD_WRITE_TIMEOUT,
                     caption="🎵 Downloaded audio"
                 )
             else:
-                await context.bot.send_video(
+                message = await bot.send_video(
                     chat_id=chat_id,
                     video=file,
+                    write_timeout=UPLOAD_WRITE_TIMEOUT,
                     caption="🎬 Downloaded video"
                 )
+        remember_file_id(cache_key, message)
         return True
     except Exception as e:
         logger.error(f"File send error: {e}")
-        await context.bot.send_message(
+        await bot.send_message(
             chat_id=chat_id,
             text="❌ Failed to send file. It might be too large."
         )
         return False
     finally:
-        # Clean up file
+        # Tear down the job workspace
+        if release:
+            release()
+        else:
+            downloader.release_workspace(file_path)
+
+async def run_queued_job(bot, job):
+    """Run one job taken from the download queue."""
+    target = JobTarget(bot, job['user_id'], job['chat_id'], job['message_id'])
+    # The queue already limits jobs per user; a job waits for the executor instead of being turned away
+    with executor.queued():
+        if job['kind'] == 'playlist':
+            await download_playlist(target, job['url'], bool(job['is_audio']))
+        else:
+            await download_single(target, job['url'], job['quality'], bool(job['is_audio']))
+
+async def queue_worker(bot):
+    """Take jobs from the download queue until cancelled."""
+    while True:
+        job = await asyncio.to_thread(download_queue.claim_next)
+        if job is None:
+            queue_wakeup.clear()
+            try:
+                await asyncio.wait_for(queue_wakeup.wait(), QUEUE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        logger.info(f"Starting queued job {job['id']} ({job['kind']}) for user {job['user_id']}")
+        # Run in a separate task so cancelling the job cannot stop the worker
+        task = asyncio.create_task(run_queued_job(bot, job))
+        await asyncio.wait({task})
+        
+        if task.cancelled():
+            status = 'cancelled'
+        elif task.exception() is not None:
+            logger.error(f"Queued job {job['id']} failed: {task.exception()}")
+            status = 'failed'
+        else:
+            status = 'done'
+        if not await asyncio.to_thread(download_queue.finish, job['id'], status):
+            logger.warning(f"Queued job {job['id']} was requeued while it ran; leaving it to its new owner")
+        # A finished job may let another job of the same user run
+        queue_wakeup.set()
+
+def instance_alive(owner):
+    """Return True if the front-end or worker that claimed a job is still sending heartbeats."""
+    return owner == INSTANCE_ID or shared_store.get(f"instance:{owner}") is not None
+
+def send_heartbeat(user_ids):
+    """
+    Mark this process alive and requeue jobs of stopped instances.
+    
+    Returns the number of jobs requeued and which of user_ids have a new
+    /cancel request from another instance.
+    """
+    shared_store.set(f"instance:{INSTANCE_ID}", str(time.time()), ttl=HEARTBEAT_INTERVAL * 3)
+    requeued = download_queue.recover(instance_alive)
+    cancels = []
+    for user_id in user_ids:
+        request = shared_store.get(f"cancel:{user_id}")
+        if request and seen_cancel_requests.get(user_id) != request:
+            seen_cancel_requests[user_id] = request
+            cancels.append(user_id)
+    return requeued, cancels
+
+async def instance_heartbeat():
+    """Send heartbeats until cancelled, acting on requeued jobs and cancel requests."""
+    while True:
         try:
-            os.remove(file_path)
+            requeued, cancels = await asyncio.to_thread(send_heartbeat, executor.active_users())
+            if requeued:
+                logger.info(f"Requeued {requeued} jobs of stopped instances")
+                queue_wakeup.set()
+            for user_id in cancels:
+                executor.cancel_user(user_id)
         except Exception as e:
-            logger.error(f"File cleanup error: {e}")
+            logger.error(f"Heartbeat error: {e}")
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+def start_download_workers(bot):
+    """Start tasks that take jobs from the download queue and run them, talking to users through bot."""
+    global queue_wakeup, heartbeat_task
+    queue_wakeup = asyncio.Event()
+    if bot:
+        for _ in range(QUEUE_WORKERS):
+            queue_workers.append(asyncio.create_task(queue_worker(bot)))
+        logger.info(f"Started {QUEUE_WORKERS} queue workers")
+    else:
+        logger.info("Queued downloads are left to worker processes")
+    if shared_store:
+        heartbeat_task = asyncio.create_task(instance_heartbeat())
+
+async def start_queue_workers(application):
+    """Start download queue workers once the application is initialized."""
+    start_download_workers(None if EXTERNAL_WORKERS else application.bot)
+
+async def stop_queue_workers(application):
+    """Stop download queue workers. Running jobs are requeued on the next start."""
+    for worker in queue_workers:
+        worker.cancel()
+    await asyncio.gather(*queue_workers, return_exceptions=True)
+    queue_workers.clear()
+    if heartbeat_task:
+        heartbeat_task.cancel()
+        # Let the other instances requeue this one's jobs without waiting for the heartbeat to expire
+        shared_store.delete(f"instance:{INSTANCE_ID}")
+
+def is_unordered_update(update):
+    """Return True for commands that must not wait behind their chat's earlier updates."""
+    message = getattr(update, 'message', None)
+    text = (message.text or '') if message else ''
+    return text.split('@')[0].split(' ')[0] in UNORDERED_COMMANDS
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors."""
     logger.error(f"Update {update} caused error {context.error}")
 
-def main():
-    """Main function to run the bot."""
-    global downloader
+def directory_size(path):
+    """Return the bytes used by the files under path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                # Removed while walking
+                pass
+    return total
+
+class StateCollector:
+    """Report queue, worker, cache and workspace state kept elsewhere at each scrape."""
     
-    if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
-        print("❌ Please set your bot token in the BOT_TOKEN variable!")
-        print("Get your token from @BotFather on Telegram")
-        return
+    def collect(self):
+        queue_jobs = GaugeMetricFamily('ytbot_queue_jobs', 'Jobs in the download queue', labels=['status'])
+        workers_busy = GaugeMetricFamily('ytbot_workers_busy', 'Busy workers of this process', labels=['stage'])
+        workers = GaugeMetricFamily('ytbot_workers', 'Workers of this process', labels=['stage'])
+        cache_requests = CounterMetricFamily('ytbot_cache_requests', 'Cache lookups', labels=['cache', 'result'])
+        cache_hit_ratio = GaugeMetricFamily('ytbot_cache_hit_ratio', 'Share of cache lookups that hit', labels=['cache'])
+        cache_entries = GaugeMetricFamily('ytbot_cache_entries', 'Entries in the cache', labels=['cache'])
+        temp_bytes = GaugeMetricFamily('ytbot_temp_bytes', 'Bytes held by download workspaces', labels=['location'])
+        temp_free_bytes = GaugeMetricFamily(
+            'ytbot_temp_free_bytes', 'Free space left for download workspaces', labels=['location']
+        )
+        try:
+            if download_queue and not isinstance(download_queue, RemoteQueue):
+                for status, count in download_queue.depth().items():
+                    queue_jobs.add_metric([status], count)
+            if executor:
+                workers_busy.add_metric(['download'], executor.active_jobs())
+                workers.add_metric(['download'], executor.max_workers)
+            if postprocess_stage:
+                stats = postprocess_stage.stats()
+                workers_busy.add_metric(['postprocess'], stats['running'])
+                workers.add_metric(['postprocess'], stats['workers'])
+            for name, cache in (('file_id', file_id_cache), ('metadata', metadata_cache)):
+                if cache:
+                    stats = cache.stats()
+                    cache_requests.add_metric([name, 'hit'], stats['hits'])
+                    cache_requests.add_metric([name, 'miss'], stats['misses'])
+                    cache_hit_ratio.add_metric([name], stats['hit_ratio'])
+                    cache_entries.add_metric([name], stats['entries'])
+            if downloader and os.path.isdir(downloader.temp_dir):
+                temp_bytes.add_metric(['disk'], directory_size(downloader.temp_dir))
+                temp_free_bytes.add_metric(['disk'], shutil.disk_usage(downloader.temp_dir).free)
+            if memory_spool:
+                stats = memory_spool.stats()
+                temp_bytes.add_metric(['spool'], stats['used'])
+                temp_free_bytes.add_metric(['spool'], stats['budget'] - stats['used'])
+        except Exception as e:
+            # Still report what was read, and the other metrics
+            logger.error(f"Collecting state metrics failed: {e}")
+        return [queue_jobs, workers_busy, workers, cache_requests, cache_hit_ratio,
+                cache_entries, temp_bytes, temp_free_bytes]
+
+REGISTRY.register(StateCollector())
+
+def start_metrics_server(port):
+    """Serve /metrics on port. A port that is taken only disables metrics for this process."""
+    global metrics_server
+    try:
+        metrics_server, _ = start_http_server(port, addr=METRICS_LISTEN)
+        print(f"✅ Serving metrics at http://{METRICS_LISTEN}:{metrics_server.server_address[1]}/metrics")
+    except OSError as e:
+        logger.error(f"Could not serve metrics on port {port}: {e}")
+        print(f"⚠️ Metrics disabled: port {port} is not available")
+
+def init_download_stage(downloads=True):
+    """
+    Check yt-dlp and start the downloader, worker pool and caches.
+    
+    downloads=False skips the pools only needed to run downloads, for a
+    front-end that leaves them to worker processes. Returns False if the
+    process cannot run yt-dlp.
+    """
+    global downloader, executor, postprocess_stage, memory_spool, file_id_cache, metadata_cache
+    global MAX_FILE_SIZE, PLAYLIST_DISK_BUDGET
+    
+    if LOCAL_BOT_API_URL:
+        # The size limit follows the endpoint, and so do the limits derived from it
+        MAX_FILE_SIZE = LOCAL_BOT_API_MAX_FILE_SIZE
+        PLAYLIST_DISK_BUDGET = PLAYLIST_DISK_FILES * MAX_FILE_SIZE
     
     print("🔍 Checking yt-dlp installation...")
     if not check_ytdlp_installation():
@@ -628,10 +1851,10 @@ def main():
             print("✅ yt-dlp updated successfully")
             if not check_ytdlp_installation():
                 print("❌ yt-dlp still not working after update")
-                return
+                return False
         else:
             print("❌ Could not fix yt-dlp installation")
-            return
+            return False
     else:
         print("✅ yt-dlp is working properly")
     
@@ -641,24 +1864,223 @@ def main():
         print("✅ Downloader initialized")
     except Exception as e:
         print(f"❌ Failed to initialize downloader: {e}")
+        return False
+    
+    # Initialize worker pool
+    executor = DownloadExecutor(
+        max_workers=MAX_WORKERS,
+        per_user_limit=MAX_JOBS_PER_USER,
+        mode=WORKER_MODE
+    )
+    print(f"✅ Worker pool started ({MAX_WORKERS} {WORKER_MODE} workers)")
+    
+    if downloads and SEPARATE_POSTPROCESSING:
+        postprocess_stage = PostprocessStage(max_workers=POSTPROCESS_WORKERS)
+        print(f"✅ Postprocess pool started ({POSTPROCESS_WORKERS} processes)")
+    
+    if downloads and SPOOL_DIR and os.path.isdir(SPOOL_DIR):
+        memory_spool = MemorySpool(SPOOL_DIR, SPOOL_BUDGET, SPOOL_THRESHOLD)
+        downloader.spool_dir = memory_spool.root
+        print(f"✅ Memory spool ready ({memory_spool.budget // (1024 * 1024)}MB in {SPOOL_DIR})")
+    
+    # Open the Telegram file_id cache
+    file_id_cache = FileIdCache(FILE_ID_CACHE_PATH, ttl=FILE_ID_CACHE_TTL)
+    expired = file_id_cache.purge_expired()
+    print(f"✅ File cache ready ({file_id_cache.stats()['entries']} files, {expired} expired entries removed)")
+    
+    metadata_cache = MetadataCache(
+        max_entries=METADATA_CACHE_SIZE,
+        ttl=METADATA_CACHE_TTL,
+        disk_path=METADATA_CACHE_PATH
+    )
+    return True
+
+def close_download_stage():
+    """Shut down what init_download_stage started, and the metrics server."""
+    if metrics_server:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+    if executor:
+        executor.shutdown()
+    if postprocess_stage:
+        postprocess_stage.shutdown()
+    if memory_spool:
+        memory_spool.close()
+    if file_id_cache:
+        file_id_cache.close()
+    if metadata_cache:
+        metadata_cache.close()
+    if downloader:
+        downloader.cleanup()
+
+def build_bot():
+    """Create a Bot for a worker process, with the same endpoint and API pool as the front-end."""
+    endpoint = {}
+    if LOCAL_BOT_API_URL:
+        endpoint = {'base_url': LOCAL_BOT_API_URL, 'local_mode': True}
+        if LOCAL_BOT_API_FILE_URL:
+            endpoint['base_file_url'] = LOCAL_BOT_API_FILE_URL
+    request = HTTPXRequest(connection_pool_size=API_POOL_SIZE, pool_timeout=API_POOL_TIMEOUT)
+    return Bot(BOT_TOKEN, request=request, **endpoint)
+
+async def serve_download_worker():
+    """Run queued jobs until cancelled."""
+    async with build_bot() as bot:
+        start_download_workers(bot)
+        try:
+            await asyncio.gather(*queue_workers)
+        finally:
+            await stop_queue_workers(None)
+
+def run_download_worker(queue_location=QUEUE_PATH, store_url=SHARED_STORE_URL, token=STATE_SERVER_TOKEN,
+                        metrics_port=None):
+    """
+    Run queued downloads in this process for the bot's front-ends.
+    
+    queue_location is the queue's SQLite path on this host, or the URL of
+    a front-end's state server for workers on other hosts. metrics_port,
+    if given, serves this worker's metrics. Blocks until interrupted.
+    """
+    global download_queue, shared_store
+    
+    if queue_location.startswith(('http://', 'https://')):
+        shared_store = RemoteStore(queue_location, token)
+        download_queue = RemoteQueue(queue_location, INSTANCE_ID, token)
+    elif store_url:
+        shared_store = open_store(store_url)
+        download_queue = open_queue(store_url, queue_location, per_user_limit=MAX_JOBS_PER_USER, owner=INSTANCE_ID)
+    else:
+        print("❌ Workers need a shared store (SHARED_STORE_URL) to report that they are alive")
         return
     
+    try:
+        if init_download_stage():
+            if metrics_port:
+                start_metrics_server(metrics_port)
+            print(f"⚙️ Worker {INSTANCE_ID} taking jobs from {queue_location}")
+            asyncio.run(serve_download_worker())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_download_stage()
+        download_queue.close()
+        shared_store.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Telegram bot that downloads YouTube videos.")
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT,
+                        help="Webhook port of this front-end, to run several behind a reverse proxy")
+    return parser.parse_args()
+
+def main():
+    """Main function to run the bot."""
+    global url_cache, download_queue, update_processor, shared_store, state_server
+    
+    args = parse_args()
+    
+    if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
+        print("❌ Please set your bot token in the BOT_TOKEN variable!")
+        print("Get your token from @BotFather on Telegram")
+        return
+    
+    if (EXTERNAL_WORKERS or STATE_SERVER_PORT) and not SHARED_STORE_URL:
+        print("❌ Download workers need SHARED_STORE_URL so jobs of stopped workers can be requeued")
+        return
+    
+    if STATE_SERVER_PORT and not STATE_SERVER_TOKEN:
+        print("❌ Set STATE_SERVER_TOKEN so only your workers can use the state server")
+        return
+    
+    if not init_download_stage(downloads=not EXTERNAL_WORKERS):
+        return
+    
+    if SHARED_STORE_URL:
+        shared_store = open_store(SHARED_STORE_URL)
+        shared_store.purge_expired()
+        print(f"✅ Shared store ready ({SHARED_STORE_URL}, instance {INSTANCE_ID})")
+    
+    # Open the download queue and requeue jobs interrupted by a restart
+    download_queue = open_queue(SHARED_STORE_URL, QUEUE_PATH, per_user_limit=MAX_JOBS_PER_USER, owner=INSTANCE_ID)
+    download_queue.purge_finished()
+    # Jobs claimed by instances that are still running stay with them
+    recovered = download_queue.recover(instance_alive if shared_store else None)
+    print(f"✅ Download queue ready ({recovered} interrupted jobs requeued)")
+    
+    if STATE_SERVER_PORT:
+        state_server = StateServer(
+            shared_store, download_queue, STATE_SERVER_LISTEN, STATE_SERVER_PORT, STATE_SERVER_TOKEN
+        ).start()
+        print(f"✅ Serving the queue to remote workers on {STATE_SERVER_LISTEN}:{STATE_SERVER_PORT}")
+    
+    url_cache = UrlStore(
+        max_entries=URL_CACHE_SIZE,
+        max_bytes=URL_CACHE_MAX_BYTES,
+        ttl=URL_CACHE_TTL,
+        db_path=URL_CACHE_PATH,
+        store=shared_store
+    )
+    
+    # Updates from different chats run concurrently, those from one chat in order
+    update_processor = ChatOrderedUpdateProcessor(
+        MAX_CONCURRENT_UPDATES,
+        max_pending=MAX_PENDING_UPDATES,
+        bypass=is_unordered_update
+    )
+    
     # Create application
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(update_processor)
+        .connection_pool_size(API_POOL_SIZE)
+        .pool_timeout(API_POOL_TIMEOUT)
+        .get_updates_connection_pool_size(GET_UPDATES_POOL_SIZE)
+        .get_updates_read_timeout(GET_UPDATES_READ_TIMEOUT)
+        .post_init(start_queue_workers)
+        .post_shutdown(stop_queue_workers)
+    )
+    if LOCAL_BOT_API_URL:
+        builder = builder.base_url(LOCAL_BOT_API_URL).local_mode(True)
+        if LOCAL_BOT_API_FILE_URL:
+            builder = builder.base_file_url(LOCAL_BOT_API_FILE_URL)
+        print(f"✅ Using local Bot API server at {LOCAL_BOT_API_URL}")
+    application = builder.build()
     
     # Add handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("cancel", cancel_command))
+    application.add_handler(CommandHandler("queue", queue_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    # Handlers block so the update processor can keep each chat's updates in order
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_url))
     application.add_handler(CallbackQueryHandler(button_callback))
     application.add_error_handler(error_handler)
     
+    port = args.port
+    if METRICS_PORT:
+        # Front-ends started on later webhook ports take the matching later metrics ports
+        start_metrics_server(METRICS_PORT + port - WEBHOOK_PORT)
+    
+    print(f"✅ Handling up to {MAX_CONCURRENT_UPDATES} updates at once ({API_POOL_SIZE} API connections)")
     print("🤖 Bot is starting...")
     print("Press Ctrl+C to stop the bot")
     
     # Run the bot
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if WEBHOOK_URL:
+            print(f"🌐 Receiving updates for {WEBHOOK_URL} on {WEBHOOK_LISTEN}:{port}")
+            application.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=port,
+                url_path=urllib.parse.urlparse(WEBHOOK_URL).path.lstrip('/'),
+                webhook_url=WEBHOOK_URL,
+                secret_token=WEBHOOK_SECRET_TOKEN,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES
+            )
+        else:
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
     except Exception as e:
         logger.error(f"Bot error: {e}")
         print(f"❌ Bot error: {e}")
@@ -672,6 +2094,12 @@ if __name__ == '__main__':
         print(f"❌ Critical error: {e}")
         logger.error(f"Critical error: {e}")
     finally:
-        if downloader:
-            downloader.cleanup()
-        print("🧹 Cleanup completed")
\ No newline at end of file
+        close_download_stage()
+        if state_server:
+            state_server.stop()
+        if url_cache:
+            url_cache.close()
+        if download_queue:
+            download_queue.close()
+        if shared_store:
+            shared_store.close()
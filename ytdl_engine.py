@@ -0,0 +1,228 @@
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Download profiles, matching the CLI menu options
+PROFILE_VIDEO = 'video'
+PROFILE_AUDIO = 'audio'
+PROFILE_PLAYLIST_VIDEO = 'playlist_video'
+PROFILE_PLAYLIST_AUDIO = 'playlist_audio'
+PROFILES = (PROFILE_VIDEO, PROFILE_AUDIO, PROFILE_PLAYLIST_VIDEO, PROFILE_PLAYLIST_AUDIO)
+
+# Audio output: re-encode to MP3, or keep the source stream (m4a/opus), only remuxing it
+AUDIO_FORMAT_MP3 = 'mp3'
+AUDIO_FORMAT_NATIVE = 'native'
+AUDIO_FORMATS = (AUDIO_FORMAT_MP3, AUDIO_FORMAT_NATIVE)
+
+SINGLE_TEMPLATE = "%(title)s [%(id)s].%(ext)s"
+PLAYLIST_TEMPLATE = "%(playlist_index)02d - %(title)s [%(id)s].%(ext)s"
+
+
+def ytdlp_version():
+    """Return the installed yt-dlp version string without importing yt_dlp."""
+    from importlib.metadata import version
+    return version('yt-dlp')
+
+
+def audio_postprocessor(audio_format, mp3_quality='0'):
+    """
+    Return the FFmpegExtractAudio settings for an audio format.
+
+    AUDIO_FORMAT_NATIVE keeps m4a and opus streams as they are, copying the
+    stream into a new container when needed, and only falls back to MP3 for
+    codecs without an audio-only container. Any other value is passed to
+    yt-dlp as an --audio-format mapping, e.g. 'm4a>m4a/mp3' keeps m4a and
+    converts everything else to MP3.
+    """
+    if audio_format == AUDIO_FORMAT_NATIVE:
+        return {'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}
+    return {'key': 'FFmpegExtractAudio', 'preferredcodec': audio_format, 'preferredquality': mp3_quality}
+
+
+def result_files(info):
+    """
+    Collect the final files yt-dlp reports for an extract_info(download=True) result.
+
+    Works for single videos and playlists. Each file is a dict with 'path',
+    'size', 'duration', 'title' and 'id'. Entries that failed to download
+    are counted in the second return value.
+    """
+    files = []
+    failed = 0
+    if not info:
+        return files, 1
+
+    if info.get('_type') == 'playlist':
+        for entry in info.get('entries') or []:
+            if entry is None:
+                failed += 1
+                continue
+            entry_files, entry_failed = result_files(entry)
+            files.extend(entry_files)
+            failed += entry_failed
+        return files, failed
+
+    downloads = info.get('requested_downloads') or []
+    path = downloads[-1].get('filepath') if downloads else None
+    if not path or not os.path.exists(path):
+        return files, 1
+
+    files.append({
+        'path': path,
+        'size': os.path.getsize(path),
+        'duration': info.get('duration'),
+        'title': info.get('title'),
+        'id': info.get('id'),
+    })
+    return files, failed
+
+
+class DownloadEngine:
+    """
+    In-process yt-dlp driver for the four download profiles.
+
+    YoutubeDL instances are created on first use for each profile and output
+    directory and then reused, so extractors and HTTP state are only set up
+    once per session instead of once per download. A per-download output
+    template is applied to the shared instance for that call, so naming
+    each playlist entry does not create instances. yt_dlp itself is only
+    imported when the first instance is created, which keeps it off the
+    CLI's startup path.
+    """
+
+    def __init__(self, ffmpeg_path="", max_height="1080", concurrent_fragments=1, quiet=False,
+                 audio_format=AUDIO_FORMAT_MP3):
+        if audio_format not in AUDIO_FORMATS:
+            raise ValueError(f"Unknown audio format: {audio_format}")
+        self.ffmpeg_path = ffmpeg_path
+        self.max_height = max_height
+        self.concurrent_fragments = concurrent_fragments
+        self.audio_format = audio_format
+        self.quiet = quiet
+        self._instances = {}
+
+    @staticmethod
+    def output_template(profile, output_path, output_template=None):
+        """Return the full output template for a profile, or for output_template if given."""
+        if output_template is None:
+            is_playlist = profile in (PROFILE_PLAYLIST_VIDEO, PROFILE_PLAYLIST_AUDIO)
+            output_template = PLAYLIST_TEMPLATE if is_playlist else SINGLE_TEMPLATE
+        return os.path.join(output_path, output_template).replace("\\", "/")
+
+    def build_options(self, profile, output_path, output_template=None):
+        """Build YoutubeDL options for a profile, equivalent to the old yt-dlp command lines."""
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown download profile: {profile}")
+
+        is_playlist = profile in (PROFILE_PLAYLIST_VIDEO, PROFILE_PLAYLIST_AUDIO)
+        is_audio = profile in (PROFILE_AUDIO, PROFILE_PLAYLIST_AUDIO)
+
+        opts = {
+            'outtmpl': self.output_template(profile, output_path, output_template),
+            'noplaylist': not is_playlist,
+            'ignoreerrors': True,
+            'concurrent_fragment_downloads': self.concurrent_fragments,
+            'quiet': self.quiet,
+            'noprogress': self.quiet,
+        }
+
+        if self.ffmpeg_path:
+            opts['ffmpeg_location'] = self.ffmpeg_path
+
+        if is_audio:
+            opts.update({
+                'format': 'bestaudio/best',
+                'postprocessors': [audio_postprocessor(self.audio_format)],
+            })
+        else:
+            max_height = self.max_height
+            opts.update({
+                'format': f"bestvideo[height<={max_height}]+bestaudio/best[height<={max_height}]",
+                'writeautomaticsub': True,
+                'merge_output_format': 'mp4',
+                'postprocessors': [{
+                    'key': 'FFmpegEmbedSubtitle',
+                    'already_have_subtitle': False,
+                }],
+            })
+        return opts
+
+    def _get_instance(self, profile, output_path, output_template=None):
+        """Return the long-lived YoutubeDL for a profile and output location, naming files with output_template."""
+        key = (profile, output_path)
+        ydl = self._instances.get(key)
+        if ydl is None:
+            import yt_dlp
+            ydl = yt_dlp.YoutubeDL(self.build_options(profile, output_path))
+            self._instances[key] = ydl
+        # YoutubeDL keeps its templates as a dict and reads them for every download
+        ydl.params['outtmpl']['default'] = self.output_template(profile, output_path, output_template)
+        return ydl
+
+    def download(self, url, profile, output_path, output_template=None):
+        """
+        Download url with a profile.
+
+        Returns a dict with 'success', 'files' (see result_files), 'failed'
+        (entries that could not be downloaded), 'elapsed' seconds and
+        'error' (a message, or None).
+        """
+        if not os.path.exists(output_path):
+            os.makedirs(output_path)
+
+        started = time.monotonic()
+        try:
+            ydl = self._get_instance(profile, output_path, output_template)
+            info = ydl.extract_info(url, download=True)
+            files, failed = result_files(info)
+            error = None
+        except Exception as e:
+            logger.error(f"Download error: {e}")
+            files, failed, error = [], 1, str(e)
+
+        return {
+            'success': failed == 0 and error is None and bool(files),
+            'files': files,
+            'failed': failed,
+            'elapsed': time.monotonic() - started,
+            'error': error,
+        }
+
+    def expand_playlist(self, url):
+        """List playlist entries without resolving each video. A single video yields one entry."""
+        ydl = self._instances.get('flat')
+        if ydl is None:
+            import yt_dlp
+            ydl = yt_dlp.YoutubeDL({
+                'extract_flat': 'in_playlist',
+                'skip_download': True,
+                'ignoreerrors': True,
+                'quiet': True,
+            })
+            self._instances['flat'] = ydl
+
+        info = ydl.extract_info(url, download=False)
+        if not info:
+            return []
+        if info.get('_type') != 'playlist':
+            return [{'index': 1, 'id': info.get('id'), 'title': info.get('title') or info.get('id'), 'url': url}]
+
+        entries = []
+        for index, entry in enumerate(info.get('entries') or [], start=1):
+            if not entry or not entry.get('id'):
+                continue
+            entries.append({
+                'index': index,
+                'id': entry['id'],
+                'title': entry.get('title') or entry['id'],
+                'url': entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}",
+            })
+        return entries
+
+    def close(self):
+        """Close every YoutubeDL instance."""
+        for ydl in self._instances.values():
+            ydl.close()
+        self._instances.clear()